@@ -1,21 +1,179 @@
+import os
 import sys
 import logging
+import time
 import threading
+from collections import deque
 from typing import Optional
-from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QTextEdit, QLabel, QHBoxLayout
-from PySide6.QtCore import Qt, Signal, QObject, QThread
-from PySide6.QtGui import QMovie ### NUEVO ###
-from selenium_story_notifier import main as selenium_main, RUN_START_HOUR, RUN_END_HOUR
-
-# ... (Las clases GuiLogger y NotifierWorker se quedan igual) ...
-class GuiLogger(logging.Handler, QObject):
-    log_signal = Signal(str, str)
-    def __init__(self):
-        logging.Handler.__init__(self)
-        QObject.__init__(self)
-    def emit(self, record):
-        msg = self.format(record)
-        self.log_signal.emit(record.levelname, msg)
+from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QPushButton, QListView, QLabel, QHBoxLayout, QComboBox, QAbstractItemView
+from PySide6.QtCore import Qt, Signal, QObject, QThread, QTimer, QDateTime, QAbstractListModel, QModelIndex, QSortFilterProxyModel
+from PySide6.QtGui import QMovie, QColor, QPainter ### NUEVO ###
+from PySide6.QtCharts import QChart, QChartView, QLineSeries, QDateTimeAxis, QValueAxis
+from orchestrator import main as selenium_main
+from selenium_story_notifier import RUN_START_HOUR, RUN_END_HOUR, POLL_INTERVAL_BASE, POLL_INTERVAL_RANDOM_RANGE
+from log_buffer import LogRingBuffer, BufferedLogHandler
+from notifier_logging import attach_handler, TEXT_FORMAT
+from viewer_timeseries import ViewerTimeSeries, TIMESERIES_FILE
+
+LOG_BUFFER_CAPACITY = int(os.getenv("LOG_BUFFER_CAPACITY", "5000"))
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("LOG_FLUSH_INTERVAL_MS", "250"))
+
+# Horas de historial visibles en la gráfica de espectadores
+CHART_WINDOW_HOURS = float(os.getenv("CHART_WINDOW_HOURS", "48"))
+# Entre dos ciclos hay como mínimo esta espera; una pausa mayor entre muestras indica un ciclo nuevo
+CYCLE_GAP_SECONDS = max(POLL_INTERVAL_BASE - POLL_INTERVAL_RANDOM_RANGE, 60)
+
+LOG_LEVEL_COLORS = {"INFO": "#aaffaa", "WARNING": "#ffff66", "ERROR": "#ff6666", "CRITICAL": "#ff6666"}
+
+
+class LogListModel(QAbstractListModel):
+    """
+    Modelo acotado de registros para la vista de la GUI. Guarda como máximo
+    'capacity' filas; las más antiguas se eliminan al llegar nuevos lotes.
+    """
+    def __init__(self, capacity: int, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self._rows = deque()
+        self._colors = {name: QColor(color) for name, color in LOG_LEVEL_COLORS.items()}
+        self._default_color = QColor("#e0e0ff")
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        levelno, levelname, msg = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return msg
+        if role == Qt.ItemDataRole.ForegroundRole:
+            return self._colors.get(levelname, self._default_color)
+        if role == Qt.ItemDataRole.UserRole:
+            return levelno
+        return None
+
+    def append_batch(self, batch):
+        if not batch:
+            return
+        batch = batch[-self.capacity:]
+        overflow = len(self._rows) + len(batch) - self.capacity
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self._rows.popleft()
+            self.endRemoveRows()
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(batch) - 1)
+        self._rows.extend(batch)
+        self.endInsertRows()
+
+
+class LogLevelFilterModel(QSortFilterProxyModel):
+    """Filtra las filas por nivel mínimo sin volver a generar el texto."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.min_level = logging.NOTSET
+
+    def set_min_level(self, levelno: int):
+        self.min_level = levelno
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        index = self.sourceModel().index(source_row, 0, source_parent)
+        return self.sourceModel().data(index, Qt.ItemDataRole.UserRole) >= self.min_level
+
+
+class ViewerChart(QChartView):
+    """
+    Gráfica en vivo del total y de los nuevos espectadores. Cada ciclo es un
+    punto con la suma de todas las historias activas: las muestras de un mismo
+    ciclo se acumulan en el último punto y un ciclo nuevo empieza cuando se
+    repite una historia o tras una pausa de al menos CYCLE_GAP_SECONDS. Los
+    puntos que salen de la ventana visible se eliminan por el frente, así nunca
+    se redibuja la serie completa.
+    """
+    def __init__(self, window_hours: float, parent=None):
+        self.chart_model = QChart()
+        super().__init__(self.chart_model, parent)
+        self.window_ms = int(window_hours * 3600 * 1000)
+        self.max_value = 1
+        # Ciclo en curso: historias ya sumadas, instante de la última muestra y sumas
+        self._cycle_stories = set()
+        self._cycle_last_ts = None
+        self._cycle_total = 0
+        self._cycle_new = 0
+
+        self.total_series = QLineSeries()
+        self.total_series.setName("Total")
+        self.new_series = QLineSeries()
+        self.new_series.setName("Nuevos")
+
+        self.chart_model.setTheme(QChart.ChartTheme.ChartThemeDark)
+        self.chart_model.setBackgroundVisible(False)
+        self.chart_model.addSeries(self.total_series)
+        self.chart_model.addSeries(self.new_series)
+
+        self.axis_x = QDateTimeAxis()
+        self.axis_x.setFormat("dd/MM HH:mm")
+        self.axis_y = QValueAxis()
+        self.axis_y.setLabelFormat("%d")
+        self.chart_model.addAxis(self.axis_x, Qt.AlignmentFlag.AlignBottom)
+        self.chart_model.addAxis(self.axis_y, Qt.AlignmentFlag.AlignLeft)
+        for series in (self.total_series, self.new_series):
+            series.attachAxis(self.axis_x)
+            series.attachAxis(self.axis_y)
+
+        self.setRenderHint(QPainter.RenderHint.Antialiasing)
+        self.setMinimumHeight(180)
+
+    def load_history(self, series: ViewerTimeSeries, now_seconds: float):
+        since = now_seconds - self.window_ms / 1000
+        for timestamp, story_id, total, new in series.samples_since(since):
+            self.add_sample(timestamp, story_id, total, new, update_axes=False)
+        self._update_axes()
+
+    def add_sample(self, timestamp: float, story_id: str, total: int, new: int, update_axes: bool = True):
+        new_cycle = (
+            self._cycle_last_ts is None
+            or story_id in self._cycle_stories
+            or timestamp - self._cycle_last_ts >= CYCLE_GAP_SECONDS
+        )
+        self._cycle_last_ts = timestamp
+        if new_cycle:
+            self._cycle_stories = {story_id}
+            self._cycle_total, self._cycle_new = total, new
+            x = timestamp * 1000
+            self.total_series.append(x, self._cycle_total)
+            self.new_series.append(x, self._cycle_new)
+        else:
+            self._cycle_stories.add(story_id)
+            self._cycle_total += total
+            self._cycle_new += new
+            for series, value in ((self.total_series, self._cycle_total), (self.new_series, self._cycle_new)):
+                last = series.count() - 1
+                series.replace(last, series.at(last).x(), value)
+            x = self.total_series.at(self.total_series.count() - 1).x()
+        self.max_value = max(self.max_value, self._cycle_total, self._cycle_new)
+
+        cutoff = x - self.window_ms
+        for series in (self.total_series, self.new_series):
+            expired = 0
+            while expired < series.count() and series.at(expired).x() < cutoff:
+                expired += 1
+            if expired:
+                series.removePoints(0, expired)
+        if update_axes:
+            self._update_axes()
+
+    def _update_axes(self):
+        if self.total_series.count() == 0:
+            return
+        first = self.total_series.at(0).x()
+        last = self.total_series.at(self.total_series.count() - 1).x()
+        self.axis_x.setRange(QDateTime.fromMSecsSinceEpoch(int(first)), QDateTime.fromMSecsSinceEpoch(int(max(last, first + 60000))))
+        self.axis_y.setRange(0, self.max_value * 1.1)
+
 
 class NotifierWorker(QObject):
     finished = Signal()
@@ -46,7 +204,7 @@ class NotifierGUI(QWidget):
                 #TitleLabel { font-size: 28px; font-weight: bold; color: #9f70e0; padding-bottom: 10px; }
                 #IndicatorLabel { font-size: 11px; color: #a0a0c0; text-transform: uppercase; padding-top: 5px; }
                 #IndicatorValue { font-size: 16px; font-weight: bold; color: #e0e0ff; background-color: #2a2840; border: 1px solid #3a3858; border-radius: 4px; padding: 8px; }
-                QTextEdit { background-color: #121020; border: 1px solid #3a3858; padding: 5px; font-family: Consolas, Courier New, monospace; }
+                QListView { background-color: #121020; border: 1px solid #3a3858; padding: 5px; font-family: Consolas, Courier New, monospace; }
                 QPushButton { background-color: #9f70e0; color: #ffffff; border: none; padding: 8px 16px; border-radius: 5px; font-weight: bold; }
                 QPushButton:hover { background-color: #b080f0; }
                 QPushButton:pressed { background-color: #8a60c8; }
@@ -58,7 +216,7 @@ class NotifierGUI(QWidget):
                 #TitleLabel { font-size: 28px; font-weight: bold; color: #b99767; padding-bottom: 10px; }
                 #IndicatorLabel { font-size: 11px; color: #8c8c8c; text-transform: uppercase; padding-top: 5px; }
                 #IndicatorValue { font-size: 16px; font-weight: bold; color: #d1d1d1; background-color: #2f2f2f; border: 1px solid #4a4a4a; border-radius: 2px; padding: 8px; }
-                QTextEdit { background-color: #0f0f0f; border: 1px solid #4a4a4a; padding: 5px; font-family: Consolas, Courier New, monospace; }
+                QListView { background-color: #0f0f0f; border: 1px solid #4a4a4a; padding: 5px; font-family: Consolas, Courier New, monospace; }
                 QPushButton { background-color: #2f2f2f; color: #b99767; border: 1px solid #b99767; padding: 8px 16px; border-radius: 2px; font-weight: bold; }
                 QPushButton:hover { background-color: #3f3f3f; color: #d4b27f; border-color: #d4b27f; }
                 QPushButton:pressed { background-color: #2a2a2a; }
@@ -125,14 +283,68 @@ class NotifierGUI(QWidget):
         self.story_age_text.setObjectName("IndicatorValue")
         story_age_container.addWidget(story_age_label)
         story_age_container.addWidget(self.story_age_text)
+        page_load_container = QVBoxLayout()
+        page_load_label = QLabel("Última Carga")
+        page_load_label.setObjectName("IndicatorLabel")
+        self.page_load_text = QLabel("N/A")
+        self.page_load_text.setObjectName("IndicatorValue")
+        page_load_container.addWidget(page_load_label)
+        page_load_container.addWidget(self.page_load_text)
+        peak_hours_container = QVBoxLayout()
+        peak_hours_label = QLabel("Horas Pico")
+        peak_hours_label.setObjectName("IndicatorLabel")
+        self.peak_hours_text = QLabel("N/A")
+        self.peak_hours_text.setObjectName("IndicatorValue")
+        peak_hours_container.addWidget(peak_hours_label)
+        peak_hours_container.addWidget(self.peak_hours_text)
         indicators_layout.addLayout(horario_container)
         indicators_layout.addLayout(last_check_container)
         indicators_layout.addLayout(total_viewers_container)
         indicators_layout.addLayout(story_age_container)
+        indicators_layout.addLayout(peak_hours_container)
+        indicators_layout.addLayout(page_load_container)
         layout.addLayout(indicators_layout)
 
-        self.log_area = QTextEdit()
-        self.log_area.setReadOnly(True)
+        # La serie temporal solo se lee del disco al abrir la ventana para el historial;
+        # después la gráfica y las horas pico se alimentan con las muestras del notificador.
+        try:
+            history = ViewerTimeSeries.load(TIMESERIES_FILE)
+        except Exception as e:
+            logging.error("No se pudo leer la serie temporal de %s: %s", TIMESERIES_FILE, e)
+            history = ViewerTimeSeries()
+        self.viewer_chart = ViewerChart(CHART_WINDOW_HOURS)
+        self.viewer_chart.load_history(history, QDateTime.currentSecsSinceEpoch())
+        layout.addWidget(self.viewer_chart)
+        # Nuevos espectadores por hora del día
+        self.hourly_new = history.hourly_histogram()
+        self.update_peak_hours()
+
+        log_filter_layout = QHBoxLayout()
+        # Registros que el búfer descartó porque la GUI no los recogió a tiempo
+        self.log_dropped_label = QLabel()
+        self.log_dropped_label.hide()
+        log_filter_layout.addWidget(self.log_dropped_label)
+        log_filter_layout.addStretch()
+        log_filter_label = QLabel("Nivel:")
+        self.log_level_combo = QComboBox()
+        for name, levelno in (("Todos", logging.NOTSET), ("Info", logging.INFO), ("Advertencias", logging.WARNING), ("Errores", logging.ERROR)):
+            self.log_level_combo.addItem(name, levelno)
+        self.log_level_combo.currentIndexChanged.connect(self.change_log_level_filter)
+        log_filter_layout.addWidget(log_filter_label)
+        log_filter_layout.addWidget(self.log_level_combo)
+        layout.addLayout(log_filter_layout)
+
+        # La vista se alimenta de un modelo acotado en lugar de un QTextEdit con HTML,
+        # así la memoria se mantiene constante aunque la vigilia dure semanas.
+        self.log_model = LogListModel(LOG_BUFFER_CAPACITY, self)
+        self.log_filter_model = LogLevelFilterModel(self)
+        self.log_filter_model.setSourceModel(self.log_model)
+        self.log_area = QListView()
+        self.log_area.setModel(self.log_filter_model)
+        self.log_area.setUniformItemSizes(True)
+        self.log_area.setWordWrap(False)
+        self.log_area.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.log_area.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
         layout.addWidget(self.log_area)
 
         self.start_button = QPushButton("🚀 Iniciar Vigilia")
@@ -160,11 +372,17 @@ class NotifierGUI(QWidget):
 
         self.setLayout(layout)
 
-        self.gui_logger = GuiLogger()
-        self.gui_logger.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-        logging.getLogger().addHandler(self.gui_logger)
-        logging.getLogger().setLevel(logging.INFO)
-        self.gui_logger.log_signal.connect(self.append_log)
+        # Los registros se acumulan en un búfer circular y se vuelcan por lotes con un temporizador,
+        # en lugar de cruzar de hilo con una señal por cada registro.
+        self.log_buffer = LogRingBuffer(LOG_BUFFER_CAPACITY)
+        self.gui_logger = BufferedLogHandler(self.log_buffer)
+        self.gui_logger.setFormatter(logging.Formatter(TEXT_FORMAT))
+        # El handler cuelga del QueueListener, así nunca se ejecuta en el hilo del scraper
+        attach_handler(self.gui_logger)
+        self.log_flush_timer = QTimer(self)
+        self.log_flush_timer.setInterval(LOG_FLUSH_INTERVAL_MS)
+        self.log_flush_timer.timeout.connect(self.flush_logs)
+        self.log_flush_timer.start()
 
         self.stop_flag = threading.Event()
 
@@ -191,17 +409,44 @@ class NotifierGUI(QWidget):
             self.setStyleSheet(self.THEMES[theme_name])
             self.current_theme_name = theme_name ### MODIFICADO ###
             self.update_active_animation() ### MODIFICADO ###
-            logging.info(f"Tema cambiado a: {theme_name}")
-
-    def append_log(self, level, msg):
-        color = {"INFO": "#aaffaa", "WARNING": "#ffff66", "ERROR": "#ff6666"}.get(level, "#e0e0ff")
-        self.log_area.append(f'<span style="color:{color}">{msg}</span>')
-        self.log_area.verticalScrollBar().setValue(self.log_area.verticalScrollBar().maximum())
+            logging.info("Tema cambiado a: %s", theme_name)
+
+    def flush_logs(self):
+        batch = self.log_buffer.drain()
+        if not batch:
+            return
+        scrollbar = self.log_area.verticalScrollBar()
+        at_bottom = scrollbar.value() >= scrollbar.maximum()
+        self.log_model.append_batch(batch)
+        if self.log_buffer.dropped:
+            self.log_dropped_label.setText(f"{self.log_buffer.dropped} entradas descartadas")
+            self.log_dropped_label.show()
+        # Solo seguimos el final si el usuario no se ha desplazado hacia arriba
+        if at_bottom:
+            self.log_area.scrollToBottom()
+
+    def change_log_level_filter(self, _index):
+        self.log_filter_model.set_min_level(self.log_level_combo.currentData())
 
     def update_indicators(self, data):
         self.last_check_text.setText(data.get("last_check_time", "N/A"))
         self.total_viewers_text.setText(str(data.get("total_viewers", "N/A")))
         self.story_age_text.setText(data.get("story_age", "N/A"))
+        page_load = data.get("page_load")
+        if page_load:
+            ring = f"{page_load['ring_seconds']:.1f} s" if page_load.get("ring_seconds") is not None else "N/A"
+            size = f"{'≥' if not page_load.get('complete', True) else ''}{page_load['bytes'] / 1024:.0f} KB"
+            self.page_load_text.setText(f"{page_load['mode']} · {size} · {ring}")
+        if "sample_time" in data:
+            self.viewer_chart.add_sample(data["sample_time"], data["story_id"], data["total_viewers"], data["new_viewers"])
+            if data["new_viewers"]:
+                self.hourly_new[time.localtime(data["sample_time"]).tm_hour] += data["new_viewers"]
+                self.update_peak_hours()
+
+    def update_peak_hours(self):
+        ranked = sorted(range(24), key=lambda hour: self.hourly_new[hour], reverse=True)
+        peak_hours = [hour for hour in ranked[:3] if self.hourly_new[hour] > 0]
+        self.peak_hours_text.setText(", ".join(f"{hour}:00" for hour in peak_hours) if peak_hours else "N/A")
 
     def start_notifier(self):
         logging.info("Iniciando vigilia cósmica...")
@@ -0,0 +1,63 @@
+import logging
+import threading
+from collections import deque
+from typing import List, Tuple
+
+# Entrada del registro: (nivel numérico, nombre del nivel, mensaje ya formateado)
+LogEntry = Tuple[int, str, str]
+
+
+class LogRingBuffer:
+    """
+    Búfer circular y seguro entre hilos para los registros de la GUI.
+
+    El hilo del scraper solo agrega entradas (O(1), sin señales de Qt) y la GUI
+    las recoge por lotes con un temporizador. Al superar la capacidad se descartan
+    las entradas más antiguas, así que la memoria se mantiene constante aunque
+    el programa corra durante semanas.
+    """
+
+    def __init__(self, capacity: int = 5000):
+        if capacity <= 0:
+            raise ValueError("La capacidad del búfer de registros debe ser mayor que cero.")
+        self.capacity = capacity
+        self._pending: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def append(self, levelno: int, levelname: str, msg: str):
+        with self._lock:
+            if len(self._pending) == self.capacity:
+                self.dropped += 1
+            self._pending.append((levelno, levelname, msg))
+
+    def drain(self) -> List[LogEntry]:
+        """Devuelve y vacía las entradas pendientes desde el último drenado."""
+        with self._lock:
+            if not self._pending:
+                return []
+            batch = list(self._pending)
+            self._pending.clear()
+            return batch
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+
+class BufferedLogHandler(logging.Handler):
+    """
+    Handler de logging que escribe en un LogRingBuffer en lugar de emitir una
+    señal de Qt por cada registro.
+    """
+
+    def __init__(self, buffer: LogRingBuffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            self.buffer.append(record.levelno, record.levelname, msg)
+        except Exception:
+            self.handleError(record)
@@ -0,0 +1,302 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import logging
+import threading
+import subprocess
+import urllib.request
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Canales activos, separados por comas: email, webhook, desktop, jsonl
+NOTIFY_SINKS = os.getenv("NOTIFY_SINKS", "email")
+NOTIFY_WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL")
+NOTIFY_JSONL_FILE = os.getenv("NOTIFY_JSONL_FILE", "logs/notifications.jsonl")
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "20"))
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", "3"))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "200"))
+NOTIFY_BREAKER_THRESHOLD = int(os.getenv("NOTIFY_BREAKER_THRESHOLD", "5"))
+NOTIFY_BREAKER_RESET = float(os.getenv("NOTIFY_BREAKER_RESET", "300"))
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+logger = logging.getLogger("insta-selenium.notify")
+
+_STOP = object()
+
+
+class NotificationEvent:
+    """
+    Aviso a entregar por todos los canales. 'html' es el cuerpo ya renderizado
+    para el correo; 'data' lleva los datos estructurados para los demás canales.
+    """
+
+    def __init__(self, kind: str, subject: str, html: str, priority: int = PRIORITY_NORMAL, data: Optional[Dict] = None):
+        self.kind = kind
+        self.subject = subject
+        self.html = html
+        self.priority = priority
+        self.data = data or {}
+        self.created_at = datetime.now()
+
+    def to_dict(self) -> Dict:
+        return {
+            "kind": self.kind,
+            "subject": self.subject,
+            "priority": "high" if self.priority == PRIORITY_HIGH else "normal",
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "data": self.data,
+        }
+
+
+# --- sinks ---
+class NotificationSink(ABC):
+    """Canal de notificación. 'send' es bloqueante y debe lanzar una excepción si falla."""
+
+    name = "sink"
+
+    def __init__(self, timeout: float = NOTIFY_TIMEOUT):
+        self.timeout = timeout
+
+    @abstractmethod
+    def send(self, event: NotificationEvent):
+        ...
+
+
+class EmailSink(NotificationSink):
+    name = "email"
+
+    def send(self, event):
+        # Importación diferida: el resto de canales no depende de Selenium ni del .env de SMTP
+        from selenium_story_notifier import deliver_email
+        deliver_email(event.subject, event.html, is_html=True, timeout=self.timeout)
+
+
+class WebhookSink(NotificationSink):
+    """Envía el evento como JSON por POST a una URL."""
+
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = NOTIFY_TIMEOUT, headers: Optional[Dict[str, str]] = None):
+        super().__init__(timeout)
+        self.url = url
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+
+    def send(self, event):
+        payload = json.dumps(event.to_dict(), ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.url, data=payload, headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"El webhook respondió con el estado {response.status}")
+
+
+class DesktopSink(NotificationSink):
+    """Notificación de escritorio con la herramienta nativa del sistema."""
+
+    name = "desktop"
+
+    def send(self, event):
+        message = ", ".join(event.data.get("viewers", [])) or event.kind
+        env = None
+        if sys.platform.startswith("win"):
+            # -Command no rellena $args: todo lo que sigue se concatena al script.
+            # El título y el mensaje viajan por variables de entorno para no tener que escaparlos.
+            script = (
+                "Add-Type -AssemblyName System.Windows.Forms;"
+                "$n = New-Object System.Windows.Forms.NotifyIcon;"
+                "$n.Icon = [System.Drawing.SystemIcons]::Information;"
+                "$n.Visible = $true;"
+                "$n.ShowBalloonTip(10000, $env:ALMA_NOTIFY_TITLE, $env:ALMA_NOTIFY_MESSAGE, 'Info');"
+                "Start-Sleep -Seconds 5; $n.Dispose()"
+            )
+            command = ["powershell", "-NoProfile", "-NonInteractive", "-Command", script]
+            env = {**os.environ, "ALMA_NOTIFY_TITLE": event.subject, "ALMA_NOTIFY_MESSAGE": message}
+        elif sys.platform == "darwin":
+            command = ["osascript", "-e", "on run argv\ndisplay notification (item 2 of argv) with title (item 1 of argv)\nend run", event.subject, message]
+        elif shutil.which("notify-send"):
+            command = ["notify-send", "--app-name=Alma", event.subject, message]
+        else:
+            raise RuntimeError("No hay una herramienta de notificaciones de escritorio disponible.")
+        subprocess.run(command, check=True, timeout=self.timeout, capture_output=True, env=env)
+
+
+class JsonlSink(NotificationSink):
+    """
+    Agrega cada evento como una línea JSON a un archivo. La escritura es local
+    y no tiene un tiempo límite propio: si el disco se bloquea, solo se detiene
+    el carril de este canal, y NotificationDispatcher.close no la espera más de
+    su 'timeout'.
+    """
+
+    name = "jsonl"
+
+    def __init__(self, path: str = NOTIFY_JSONL_FILE):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def send(self, event):
+        line = json.dumps(event.to_dict(), ensure_ascii=False)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# --- dispatch ---
+class CircuitBreaker:
+    """
+    Tras 'failure_threshold' fallos seguidos abre el circuito y descarta envíos
+    durante 'reset_timeout' segundos; después deja pasar un único intento de
+    prueba (semiabierto) y rechaza los demás hasta conocer su resultado: si
+    sale bien se cierra y si falla se vuelve a abrir.
+    """
+
+    def __init__(self, failure_threshold: int = NOTIFY_BREAKER_THRESHOLD, reset_timeout: float = NOTIFY_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Semiabierto: este envío es la prueba; los demás carriles esperan su resultado
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self) -> bool:
+        """Registra un fallo; devuelve True si el circuito acaba de abrirse (o reabrirse tras la prueba)."""
+        with self._lock:
+            self.failures += 1
+            if self.probing:
+                self.probing = False
+                self.opened_at = time.monotonic()
+                return True
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class _SinkLane:
+    """Hilo y cola propios de un canal para un nivel de prioridad."""
+
+    def __init__(self, sink: NotificationSink, breaker: CircuitBreaker, lane: str, retries: int, queue_size: int):
+        self.sink = sink
+        self.breaker = breaker
+        self.lane = lane
+        self.retries = retries
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name=f"notify-{sink.name}-{lane}", daemon=True)
+        self.thread.start()
+
+    def put(self, event: NotificationEvent):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            logger.warning("Cola del canal %s (%s) llena; se descarta el aviso '%s'.", self.sink.name, self.lane, event.subject)
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            try:
+                if event is _STOP:
+                    return
+                self._deliver(event)
+            finally:
+                self.queue.task_done()
+
+    def _deliver(self, event: NotificationEvent):
+        for attempt in range(1, self.retries + 1):
+            if not self.breaker.allow():
+                logger.warning("Circuito abierto para el canal %s; se descarta el aviso '%s'.", self.sink.name, event.subject)
+                return
+            try:
+                self.sink.send(event)
+                self.breaker.record_success()
+                return
+            except Exception as e:
+                if self.breaker.record_failure():
+                    logger.error("El canal %s falló %d veces seguidas; se pausa durante %.0f segundos.",
+                                 self.sink.name, self.breaker.failures, self.breaker.reset_timeout)
+                logger.warning("Intento %d de %d fallido en el canal %s: %s", attempt, self.retries, self.sink.name, e)
+                if attempt < self.retries:
+                    time.sleep(2 ** (attempt - 1))
+        logger.error("No se pudo entregar el aviso '%s' por el canal %s.", event.subject, self.sink.name)
+
+
+class NotificationDispatcher:
+    """
+    Reparte cada evento a todos los canales de forma concurrente. Cada canal
+    tiene su propio circuito y dos carriles (prioritario y normal) con hilo y
+    cola propios, de modo que un canal lento no retrasa a los demás y los avisos
+    de usuarios especiales no esperan detrás de los reportes.
+    """
+
+    def __init__(self, sinks: List[NotificationSink], retries: int = NOTIFY_RETRIES, queue_size: int = NOTIFY_QUEUE_SIZE):
+        self.sinks = sinks
+        self._lanes = {}
+        for sink in sinks:
+            breaker = CircuitBreaker()
+            self._lanes[sink.name] = {
+                PRIORITY_HIGH: _SinkLane(sink, breaker, "prioritario", retries, queue_size),
+                PRIORITY_NORMAL: _SinkLane(sink, breaker, "normal", retries, queue_size),
+            }
+
+    def dispatch(self, event: NotificationEvent):
+        """Encola el evento en cada canal sin bloquear."""
+        priority = PRIORITY_HIGH if event.priority == PRIORITY_HIGH else PRIORITY_NORMAL
+        for lanes in self._lanes.values():
+            lanes[priority].put(event)
+
+    def close(self, timeout: float = 30):
+        """Espera a que se vacíen los carriles (como máximo 'timeout' segundos) y detiene los hilos."""
+        deadline = time.monotonic() + timeout
+        lanes = [lane for lanes in self._lanes.values() for lane in lanes.values()]
+        for lane in lanes:
+            try:
+                lane.queue.put(_STOP, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                pass
+        for lane in lanes:
+            lane.thread.join(max(deadline - time.monotonic(), 0))
+            if lane.thread.is_alive():
+                logger.warning("El canal %s (%s) no terminó a tiempo; se abandonan sus avisos pendientes.", lane.sink.name, lane.lane)
+
+
+def build_sinks_from_config() -> List[NotificationSink]:
+    sinks = []
+    for name in (item.strip().lower() for item in NOTIFY_SINKS.split(",")):
+        if not name:
+            continue
+        if name == "email":
+            sinks.append(EmailSink())
+        elif name == "webhook":
+            if not NOTIFY_WEBHOOK_URL:
+                raise ValueError("NOTIFY_WEBHOOK_URL debe estar configurado para usar el canal webhook.")
+            sinks.append(WebhookSink(NOTIFY_WEBHOOK_URL))
+        elif name == "desktop":
+            sinks.append(DesktopSink())
+        elif name == "jsonl":
+            sinks.append(JsonlSink())
+        else:
+            raise ValueError(f"Canal de notificación desconocido en NOTIFY_SINKS: {name}")
+    return sinks
@@ -0,0 +1,206 @@
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import atexit
+import queue
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# Identificadores de correlación del ciclo y de la historia en curso
+_cycle_id: contextvars.ContextVar = contextvars.ContextVar("cycle_id", default=None)
+_story_id: contextvars.ContextVar = contextvars.ContextVar("story_id", default=None)
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+_exception_formatter = logging.Formatter()
+
+
+class ContextFilter(logging.Filter):
+    """Adjunta cycle_id y story_id al registro en el hilo que lo emite."""
+    def filter(self, record):
+        record.cycle_id = _cycle_id.get()
+        record.story_id = _story_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Deja pasar como máximo un registro por plantilla de mensaje cada 'interval'
+    segundos. Los suprimidos se cuentan y se informan en el siguiente registro.
+    """
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._last_emit = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        # Las advertencias y errores nunca se limitan
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_emit.get(key)
+            if last is not None and now - last < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return False
+            self._last_emit[key] = now
+            record.suppressed = self._suppressed.pop(key, 0)
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    QueueHandler que deja el mensaje sin formatear y la traza aparte en
+    exc_text, en vez de mezclarla en 'msg' como hace el de la biblioteca
+    estándar. Cada handler del listener la formatea a su manera.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            # La traza (objetos de la pila) no debe cruzar la cola
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Un objeto JSON por línea, con los identificadores de correlación."""
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for field in ("cycle_id", "story_id", "suppressed"):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _apply_component_levels(spec: str):
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = (part.strip() for part in item.split("=", 1))
+        if name and level:
+            logging.getLogger(name).setLevel(level.upper())
+
+
+def setup_logging():
+    """
+    Configura el logging del proceso una sola vez: los registros se encolan
+    desde cualquier hilo y un QueueListener los escribe en stderr y en un
+    archivo JSON Lines rotativo, sin bloquear al scraper.
+
+    La configuración se lee aquí y no al importar el módulo, para que los
+    valores del .env ya estén cargados.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        # Niveles por componente, p. ej. "insta-selenium.db=WARNING,insta-selenium.keepalive=ERROR"
+        log_levels = os.getenv("LOG_LEVELS", "")
+        log_file = os.getenv("LOG_FILE", "logs/alma.jsonl")
+        log_file_max_bytes = int(os.getenv("LOG_FILE_MAX_BYTES", str(5 * 1024 * 1024)))
+        log_file_backup_count = int(os.getenv("LOG_FILE_BACKUP_COUNT", "5"))
+        keepalive_log_interval = float(os.getenv("KEEPALIVE_LOG_INTERVAL", "600"))
+
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers = [stream_handler]
+
+        if log_file:
+            log_dir = os.path.dirname(log_file)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                log_file, maxBytes=log_file_max_bytes, backupCount=log_file_backup_count, encoding="utf-8"
+            )
+            file_handler.setFormatter(JsonLinesFormatter())
+            handlers.append(file_handler)
+
+        queue_handler = ContextQueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(ContextFilter())
+
+        root = logging.getLogger()
+        root.handlers = [queue_handler]
+        root.setLevel(log_level)
+        _apply_component_levels(log_levels)
+        logging.getLogger("insta-selenium.keepalive").addFilter(RateLimitFilter(keepalive_log_interval))
+
+        _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def attach_handler(handler: logging.Handler):
+    """Añade un handler al QueueListener (p. ej. el de la GUI) para que también reciba los registros."""
+    setup_logging()
+    with _setup_lock:
+        _listener.stop()
+        _listener.handlers = _listener.handlers + (handler,)
+        _listener.start()
+
+
+def shutdown_logging():
+    """Vacía la cola y detiene el listener."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def new_cycle_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def bind_cycle(cycle_id: Optional[str]):
+    """Fija el cycle_id del hilo actual y limpia el story_id anterior."""
+    _cycle_id.set(cycle_id)
+    _story_id.set(None)
+
+
+def bind_story(story_id: Optional[str]):
+    _story_id.set(story_id)
+
+
+@contextmanager
+def log_context(cycle_id: Optional[str] = None, story_id: Optional[str] = None):
+    """Fija cycle_id y/o story_id para los registros emitidos dentro del bloque."""
+    tokens = []
+    if cycle_id is not None:
+        tokens.append((_cycle_id, _cycle_id.set(cycle_id)))
+    if story_id is not None:
+        tokens.append((_story_id, _story_id.set(story_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
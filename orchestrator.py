@@ -0,0 +1,516 @@
+import os
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from selenium.common.exceptions import WebDriverException
+
+# Primero: carga el .env antes de que los demás módulos lean su configuración
+from selenium_story_notifier import (
+    SMTP_USER,
+    SMTP_PASS,
+    RUN_START_HOUR,
+    RUN_END_HOUR,
+    ENABLE_DB_LOGGING,
+    SeleniumScraper,
+    build_hourly_report_email,
+    save_users_and_views,
+    load_seen,
+    save_seen,
+    load_timeseries,
+    save_timeseries,
+    load_analytics,
+    save_analytics,
+    load_runtime_state,
+    save_runtime_state,
+    build_new_viewers_email,
+    build_lost_track_email,
+    is_in_run_window,
+    seconds_until_run_window,
+    next_poll_interval,
+)
+from notifier_logging import new_cycle_id, bind_cycle, bind_story
+from notification_sinks import NotificationDispatcher, NotificationEvent, PRIORITY_NORMAL, build_sinks_from_config
+from watch_list import load_watch_list
+from report_aggregator import RollingWindowAggregator
+
+# Tamaño máximo de cada cola; al llenarse, el scraper espera (contrapresión)
+ORCHESTRATOR_QUEUE_SIZE = int(os.getenv("ORCHESTRATOR_QUEUE_SIZE", "100"))
+# Segundos que se esperan al detenerse para vaciar las colas pendientes
+ORCHESTRATOR_DRAIN_TIMEOUT = float(os.getenv("ORCHESTRATOR_DRAIN_TIMEOUT", "30"))
+KEEPALIVE_INTERVAL = 60
+STOP_FLAG_POLL_INTERVAL = 0.5
+# Se incrementa si cambia el formato del estado de ejecución; un estado de otra versión se descarta
+RUNTIME_STATE_VERSION = 1
+
+logger = logging.getLogger("insta-selenium.orchestrator")
+keepalive_logger = logging.getLogger("insta-selenium.keepalive")
+
+
+class SystemClock:
+    """Reloj real. El simulador lo sustituye por un reloj virtual con la misma interfaz."""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    async def sleep(self, seconds: float, stop_event: asyncio.Event):
+        """Duerme hasta 'seconds' o hasta que se active 'stop_event'."""
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+
+
+class StoryOrchestrator:
+    """
+    Orquestador asíncrono de la vigilia.
+
+    El scraper corre como una tarea y delega cada llamada bloqueante de
+    WebDriver a un ejecutor de un solo hilo (el driver no es seguro entre hilos).
+    Las notificaciones, la persistencia y las actualizaciones de la GUI son
+    consumidores independientes de colas acotadas, de modo que un SMTP lento ya
+    no alarga el ciclo y, si se acumula trabajo, el scraper espera en lugar de
+    crecer sin límite. Los avisos se reparten a los canales configurados a
+    través de un NotificationDispatcher.
+    """
+
+    def __init__(self, stop_flag: Optional[threading.Event] = None, update_gui_callback=None,
+                 clock=None, scraper=None, dispatcher=None, views_writer=save_users_and_views,
+                 seen_loader=load_seen, seen_saver=save_seen,
+                 timeseries_loader=load_timeseries, timeseries_saver=save_timeseries,
+                 analytics_loader=load_analytics, analytics_saver=save_analytics,
+                 checkpoint_loader=load_runtime_state, checkpoint_saver=save_runtime_state, watch_list=None,
+                 rng: Optional[random.Random] = None):
+        self.stop_flag = stop_flag
+        self.update_gui_callback = update_gui_callback
+        self.clock = clock or SystemClock()
+        self.scraper = scraper or SeleniumScraper()
+        self.dispatcher = dispatcher or NotificationDispatcher(build_sinks_from_config())
+        self.views_writer = views_writer
+        self.seen_saver = seen_saver
+        self.timeseries_loader = timeseries_loader
+        self.timeseries_saver = timeseries_saver
+        self.analytics_loader = analytics_loader
+        self.analytics_saver = analytics_saver
+        self.checkpoint_saver = checkpoint_saver
+        # Generador de la espera aleatoria entre ciclos
+        self.rng = rng or random.Random()
+        # Se compila una sola vez; cada lote de espectadores se compara en una pasada
+        self.watch_list = watch_list if watch_list is not None else load_watch_list()
+
+        self.seen = seen_loader()
+        self.story_id = None
+        self.relative_time = "N/A"
+        self._restore_state(checkpoint_loader())
+
+        self._driver_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webdriver")
+        self._io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="alma-io")
+
+    # --- runtime state ---
+    def _restore_state(self, state: dict):
+        """
+        Restaura el estado guardado al final del último ciclo. Sin él se arranca
+        en frío: nadie se da por visto, el reporte empieza vacío y el primer
+        ciclo se ejecuta de inmediato.
+        """
+        if state and state.get("version") != RUNTIME_STATE_VERSION:
+            logger.warning("El estado de ejecución guardado es de otra versión (%s); se arranca en frío.", state.get("version"))
+            state = {}
+        # Solo se conservan los usuarios cuya entrada sigue en la lista y se sigue entre ciclos
+        self.special_user_seen_status = {
+            user: seen for user, seen in state.get("special_user_seen_status", {}).items() if self._tracked_entry(user) is not None
+        }
+        # Ventana deslizante del reporte horario, alimentada por todas las historias
+        self.report = RollingWindowAggregator.from_dict(state["report"]) if "report" in state else RollingWindowAggregator()
+        # Por historia activa: número de espectadores de la última lectura del panel y quiénes faltaban en él
+        self.view_cursors = dict(state.get("view_cursors", {}))
+        # Los cursores solo ahorran la lectura del panel en el primer ciclo tras reanudar;
+        # después cada ciclo lee el panel completo y corrige cualquier lectura parcial
+        self._warm_start = bool(self.view_cursors)
+        scheduler = state.get("scheduler", {})
+        last_report_time = scheduler.get("last_report_time")
+        self.last_report_time = datetime.fromtimestamp(last_report_time) if last_report_time is not None else self.clock.now()
+        self.next_cycle_at = scheduler.get("next_cycle_at")
+        if state:
+            logger.info("Estado de ejecución restaurado (guardado el %s).", datetime.fromtimestamp(state.get("saved_at", 0)).strftime("%Y-%m-%d %H:%M:%S"))
+
+    def _tracked_entry(self, user: str):
+        entry = self.watch_list.lookup(user)
+        return entry if entry is not None and entry.track else None
+
+    def _checkpoint_state(self) -> dict:
+        """Copia del estado de ejecución; se escribe desde el ejecutor de E/S."""
+        return {
+            "version": RUNTIME_STATE_VERSION,
+            "saved_at": self.clock.now().timestamp(),
+            "special_user_seen_status": dict(self.special_user_seen_status),
+            "report": self.report.to_dict(),
+            "view_cursors": dict(self.view_cursors),
+            "scheduler": {
+                "last_report_time": self.last_report_time.timestamp(),
+                "next_cycle_at": self.next_cycle_at,
+            },
+        }
+
+    # --- executors ---
+    async def _run_in(self, executor, fn, *args):
+        # Copiamos el contexto para que los registros del hilo conserven cycle_id y story_id
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(ctx.run, fn, *args))
+
+    async def _driver_call(self, fn, *args):
+        return await self._run_in(self._driver_executor, fn, *args)
+
+    async def _io_call(self, fn, *args):
+        return await self._run_in(self._io_executor, fn, *args)
+
+    # --- lifecycle ---
+    async def run(self):
+        self._stop_event = asyncio.Event()
+        self.notify_queue = asyncio.Queue(maxsize=ORCHESTRATOR_QUEUE_SIZE)
+        self.persist_queue = asyncio.Queue(maxsize=ORCHESTRATOR_QUEUE_SIZE)
+        self.gui_queue = asyncio.Queue(maxsize=ORCHESTRATOR_QUEUE_SIZE)
+
+        try:
+            await self._driver_call(self.scraper.start)
+        except WebDriverException as e:
+            logger.error("Error al iniciar el controlador de Firefox: %s", e)
+            self._shutdown_executors()
+            return
+        except ValueError as e:
+            logger.error("Error de configuración: %s", e)
+            self._shutdown_executors()
+            return
+
+        self.timeseries = await self._io_call(self.timeseries_loader)
+        self.analytics = await self._io_call(self.analytics_loader)
+        consumers = [
+            asyncio.create_task(self._notification_consumer(), name="notifications"),
+            asyncio.create_task(self._persistence_consumer(), name="persistence"),
+            asyncio.create_task(self._gui_consumer(), name="gui"),
+        ]
+        self._scraper_task = asyncio.create_task(self._scrape_loop(), name="scraper")
+        watcher = asyncio.create_task(self._watch_stop_flag(), name="stop-watcher")
+
+        try:
+            await self._scraper_task
+        except asyncio.CancelledError:
+            logger.info("Bandera de detención detectada. Saliendo del bucle principal.")
+        except Exception as e:
+            logger.exception("Error inesperado en el scraper: %s", e)
+        finally:
+            watcher.cancel()
+            await self._drain(consumers)
+            await self._io_call(self.dispatcher.close, ORCHESTRATOR_DRAIN_TIMEOUT)
+            try:
+                await self._driver_call(self.scraper.quit)
+            except Exception:
+                pass
+            await self._io_call(self.seen_saver, dict(self.seen))
+            await self._io_call(self.timeseries_saver, self.timeseries)
+            await self._io_call(self.analytics_saver, self.analytics)
+            await self._io_call(self.checkpoint_saver, self._checkpoint_state())
+            self._shutdown_executors()
+            logger.info("Saliendo.")
+
+    def stop(self):
+        """Detiene la vigilia desde el hilo del bucle de eventos."""
+        self._stop_event.set()
+        self._scraper_task.cancel()
+
+    async def _watch_stop_flag(self):
+        if self.stop_flag is None:
+            return
+        while not self.stop_flag.is_set():
+            await asyncio.sleep(STOP_FLAG_POLL_INTERVAL)
+        self.stop()
+
+    async def _drain(self, consumers):
+        """Da a los consumidores la oportunidad de vaciar sus colas antes de cancelarlos."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(self.notify_queue.join(), self.persist_queue.join(), self.gui_queue.join()),
+                timeout=ORCHESTRATOR_DRAIN_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("No se vaciaron las colas en %.0f segundos; se descartan los eventos pendientes.", ORCHESTRATOR_DRAIN_TIMEOUT)
+        for task in consumers:
+            task.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+
+    def _shutdown_executors(self):
+        self._driver_executor.shutdown(wait=False, cancel_futures=True)
+        self._io_executor.shutdown(wait=True)
+
+    async def _sleep(self, seconds: float):
+        """Duerme hasta 'seconds' o hasta que se pida detener la vigilia."""
+        await self.clock.sleep(seconds, self._stop_event)
+
+    async def _sleep_with_keepalive(self, duration_seconds: float):
+        """
+        Duerme en intervalos, enviando un comando keep-alive para evitar que la
+        sesión del driver caduque.
+        """
+        logger.info("Durmiendo por %.1f segundos (con keep-alive)...", duration_seconds)
+        remaining = duration_seconds
+        while remaining > 0 and not self._stop_event.is_set():
+            chunk = min(KEEPALIVE_INTERVAL, remaining)
+            await self._sleep(chunk)
+            remaining -= chunk
+            try:
+                await self._driver_call(self.scraper.keepalive)
+                keepalive_logger.info("Keep-alive enviado al driver.")
+            except Exception as e:
+                keepalive_logger.warning("No se pudo enviar el keep-alive, la conexión puede estar perdida: %s", e)
+                break
+
+    # --- producer ---
+    async def _scrape_loop(self):
+        if not await self._driver_call(self.scraper.load_profile):
+            return
+
+        # Tras un reinicio se respeta la espera que quedaba pendiente antes del siguiente ciclo
+        if self.next_cycle_at is not None:
+            remaining = self.next_cycle_at - self.clock.now().timestamp()
+            if remaining > 0:
+                logger.info("Reanudando la vigilia; faltan %.0f segundos para el siguiente ciclo.", remaining)
+                await self._sleep_with_keepalive(remaining)
+
+        while not self._stop_event.is_set():
+            current_time = self.clock.now()
+
+            if not is_in_run_window(current_time.hour):
+                logger.info("Fuera del horario de ejecución (%d:00 - %d:00). Durmiendo hasta la próxima hora de inicio.", RUN_START_HOUR, RUN_END_HOUR)
+                await self._sleep(seconds_until_run_window(current_time))
+                continue
+
+            if (current_time - self.last_report_time) >= timedelta(hours=1):
+                await self._queue_hourly_report(current_time)
+
+            bind_cycle(new_cycle_id())
+            await self._run_cycle()
+            interval = next_poll_interval(self.rng)
+            self.next_cycle_at = self.clock.now().timestamp() + interval
+            await self.persist_queue.put(("checkpoint", self._checkpoint_state()))
+            await self._sleep_with_keepalive(interval)
+
+    async def _queue_hourly_report(self, current_time: datetime):
+        logger.info("Enviando reporte horario...")
+        report = self.report.payload(current_time.timestamp())
+        subject, body_html = build_hourly_report_email(
+            report,
+            current_time.strftime("%Y-%m-%d %H:%M:%S"),
+            self.watch_list.match(report["special_users"]),
+            self.watch_list.featured_labels(),
+        )
+        await self.notify_queue.put(NotificationEvent("hourly_report", subject, body_html, PRIORITY_NORMAL, {
+            "story_id": report["story_id"],
+            "total_viewers": report["total_viewers"],
+            "viewers": report["new_viewers"],
+            "special_users": report["special_users"],
+            "stories": report["stories"],
+        }))
+        # El siguiente reporte cubre desde aquí, sin huecos entre reportes
+        self.report.start_period(current_time.timestamp())
+        self.last_report_time = current_time
+
+    async def _run_cycle(self):
+        logger.info("Comprobando nuevos espectadores de historias...")
+
+        # load_profile ya espera al anillo de historia, no hace falta una pausa fija
+        if not await self._driver_call(self.scraper.load_profile):
+            return
+
+        if not await self._driver_call(self.scraper.open_latest_story):
+            logger.warning("No se pudo abrir la historia en este momento. Se reintentará más tarde.")
+            self.story_id = None
+            await self.gui_queue.put({
+                "last_check_time": self.clock.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "total_viewers": "N/A",
+                "story_age": "N/A",
+            })
+            return
+
+        # 🔹 recorrer TODAS las historias
+        has_more_stories = True
+        all_viewers_this_cycle = set()
+        view_cursors = {}
+        while has_more_stories:
+            self.relative_time, self.story_id = await self._driver_call(self.scraper.get_story_info)
+            bind_story(self.story_id)
+            if not self.story_id:
+                logger.warning("No se pudo obtener un ID único para la historia. Pasando a la siguiente.")
+                has_more_stories = await self._driver_call(self.scraper.next_story)
+                continue
+
+            # Tras reanudar, si el contador del botón no cambió desde la última lectura, el panel no tiene a nadie nuevo
+            view_count = await self._driver_call(self.scraper.get_view_count)
+            cursor = self.view_cursors.get(self.story_id) if self._warm_start else None
+            if view_count is not None and cursor and cursor["count"] == view_count and self.story_id in self.seen:
+                logger.info("El número de espectadores no cambió (%d); se omite el panel.", view_count)
+                missing = set(cursor["missing"])
+                viewers = [viewer for viewer in self.seen[self.story_id] if viewer not in missing]
+            else:
+                viewers = await self._driver_call(self.scraper.fetch_viewers)
+            all_viewers_this_cycle.update(viewers)
+            await self._process_story(self.story_id, self.relative_time, viewers)
+
+            # Un panel vacío con contador positivo es una lectura fallida; no se avanza el cursor
+            if view_count is not None and (viewers or view_count == 0):
+                # 'missing' guarda a quienes siguen en 'seen' pero ya no aparecen en el panel
+                view_cursors[self.story_id] = {"count": view_count, "missing": sorted(set(self.seen.get(self.story_id, [])) - set(viewers))}
+
+            # Intentar pasar a la siguiente historia
+            has_more_stories = await self._driver_call(self.scraper.next_story)
+
+        await self._check_special_users(all_viewers_this_cycle)
+        # Las historias que ya no aparecen caducaron; sus cursores se descartan
+        self.view_cursors = view_cursors
+        self._warm_start = False
+        await self.persist_queue.put(("cycle_end",))
+
+    async def _process_story(self, story_id: str, relative_time: str, viewers: list):
+        total_views = len(viewers)
+
+        if story_id not in self.seen:
+            self.seen[story_id] = []
+            logger.info("Nueva historia detectada con ID: %s", story_id)
+
+        prev = set(self.seen.get(story_id, []))
+        new = set(viewers) - prev
+
+        now = self.clock.now()
+        sample_time = now.timestamp()
+        self.report.observe_story(sample_time, story_id, total_views, relative_time)
+        await self.persist_queue.put(("sample", sample_time, story_id, total_views, len(new)))
+        await self.gui_queue.put({
+            "last_check_time": now.strftime("%Y-%m-%d %H:%M:%S"),
+            "total_viewers": total_views,
+            "story_age": relative_time,
+            "story_id": story_id,
+            "sample_time": sample_time,
+            "new_viewers": len(new),
+            "page_load": dict(self.scraper.last_load_metrics),
+        })
+
+        if not new:
+            logger.info("No se encontraron nuevos espectadores en esta revisión. Total de espectadores: %d", total_views)
+            return
+
+        logger.info("Se han detectado nuevos espectadores: %s", new)
+        special_matches = self.watch_list.match(new)
+        self.report.record_new_viewers(sample_time, story_id, new, special_matches)
+
+        subject, body_html = build_new_viewers_email(new, special_matches, story_id, relative_time)
+        # Los avisos van por el carril de la entrada de mayor prioridad que coincidió
+        await self.notify_queue.put(NotificationEvent(
+            "special_viewers" if special_matches else "new_viewers",
+            subject,
+            body_html,
+            min((entry.priority for entry in special_matches.values()), default=PRIORITY_NORMAL),
+            {
+                "story_id": story_id,
+                "story_age": relative_time,
+                "total_viewers": total_views,
+                "viewers": sorted(new),
+                "special_users": sorted(special_matches),
+            },
+        ))
+
+        await self.persist_queue.put(("analytics", story_id, sorted(new), sample_time))
+        self.seen[story_id] = sorted(list(set(viewers) | prev))
+        # Copia superficial: las listas de 'seen' se reemplazan, nunca se modifican en sitio
+        await self.persist_queue.put(("seen", dict(self.seen)))
+        if ENABLE_DB_LOGGING:
+            await self.persist_queue.put(("views", list(new), story_id, total_views, set(special_matches)))
+
+    async def _check_special_users(self, all_viewers_this_cycle: set):
+        # Se ejecuta después de haber revisado TODAS las historias; solo cuentan las entradas con 'track'
+        current_special_users = {
+            user: entry for user, entry in self.watch_list.match(all_viewers_this_cycle).items() if entry.track
+        }
+        for user in sorted(set(self.special_user_seen_status) | set(current_special_users)):
+            is_currently_viewing = user in current_special_users
+            was_previously_viewing = self.special_user_seen_status.get(user, False)
+
+            if was_previously_viewing and not is_currently_viewing:
+                # Estaba viendo, pero ahora no aparece en NINGUNA historia
+                entry = self._tracked_entry(user)
+                subject, body = build_lost_track_email(user, entry)
+                await self.notify_queue.put(NotificationEvent("lost_track", subject, body, entry.priority, {"special_users": [user]}))
+                self.special_user_seen_status[user] = False
+            elif is_currently_viewing:
+                if not was_previously_viewing:
+                    # Contabiliza para el reporte horario si es un "regreso"
+                    self.report.record_special(self.clock.now().timestamp(), user)
+                self.special_user_seen_status[user] = True
+
+    # --- consumers ---
+    async def _notification_consumer(self):
+        while True:
+            event = await self.notify_queue.get()
+            try:
+                # No bloquea: cada canal entrega desde sus propios hilos
+                self.dispatcher.dispatch(event)
+            except Exception as e:
+                logger.error("Error al enviar una notificación: %s", e)
+            finally:
+                self.notify_queue.task_done()
+
+    async def _persistence_consumer(self):
+        # La serie temporal y los agregados solo los toca este consumidor, así que no necesitan candados
+        while True:
+            kind, *args = await self.persist_queue.get()
+            try:
+                if kind == "sample":
+                    self.timeseries.append(*args)
+                elif kind == "analytics":
+                    self.analytics.record_views(*args)
+                elif kind == "seen":
+                    await self._io_call(self.seen_saver, *args)
+                elif kind == "views":
+                    await self._io_call(self.views_writer, *args)
+                elif kind == "checkpoint":
+                    await self._io_call(self.checkpoint_saver, *args)
+                elif kind == "cycle_end":
+                    await self._io_call(self.timeseries_saver, self.timeseries)
+                    await self._io_call(self.analytics_saver, self.analytics)
+            except Exception as e:
+                logger.error("Error al persistir '%s': %s", kind, e)
+            finally:
+                self.persist_queue.task_done()
+
+    async def _gui_consumer(self):
+        while True:
+            data = await self.gui_queue.get()
+            try:
+                if self.update_gui_callback:
+                    self.update_gui_callback(**data)
+            except Exception as e:
+                logger.error("Error al actualizar la GUI: %s", e)
+            finally:
+                self.gui_queue.task_done()
+
+
+def main(stop_flag: Optional[threading.Event] = None, update_gui_callback=None):
+    """
+    Arranca la vigilia. El ciclo de scraping, las notificaciones, la persistencia
+    y las actualizaciones de la GUI corren en el orquestador asíncrono.
+    """
+    if not SMTP_USER or not SMTP_PASS:
+        raise ValueError("SMTP_USER y SMTP_PASS deben estar configurados en su archivo .env")
+
+    try:
+        asyncio.run(StoryOrchestrator(stop_flag=stop_flag, update_gui_callback=update_gui_callback).run())
+    except KeyboardInterrupt:
+        logger.info("Interrumpido por el usuario.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import time
+import shutil
+import sqlite3
+import argparse
+import logging
+
+from selenium_story_notifier import (
+    FIREFOX_PROFILE_PATH,
+    FIREFOX_SLIM_PROFILE_PATH,
+    INSTAGRAM_USERNAME,
+    make_driver,
+    safe_get,
+)
+
+logger = logging.getLogger("insta-selenium.profile")
+
+# Dominios cuyas cookies se necesitan para mantener la sesión de Instagram
+COOKIE_HOST_PATTERNS = ("%instagram.com", "%facebook.com", "%fbcdn.net", "%cdninstagram.com")
+# Almacenamiento del sitio (localStorage, IndexedDB) que Instagram usa para la sesión
+STORAGE_ORIGINS = ("https+++www.instagram.com", "https+++instagram.com")
+
+# Preferencias para un perfil ligero y sin escrituras innecesarias en disco
+SLIM_PROFILE_PREFS = {
+    "browser.cache.disk.enable": False,
+    "browser.cache.disk.smart_size.enabled": False,
+    "browser.sessionstore.resume_from_crash": False,
+    "browser.sessionstore.max_tabs_undo": 0,
+    "browser.shell.checkDefaultBrowser": False,
+    "browser.startup.page": 0,
+    "places.history.enabled": False,
+    "datareporting.healthreport.uploadEnabled": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "toolkit.telemetry.enabled": False,
+    "app.update.auto": False,
+    "extensions.update.enabled": False,
+}
+
+
+def _copy_sqlite(source: str, dest: str):
+    """Copia una base SQLite con la API de backup, válida aunque Firefox la tenga abierta."""
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(dest)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def create_slim_profile(source: str = FIREFOX_PROFILE_PATH, dest: str = FIREFOX_SLIM_PROFILE_PATH):
+    """
+    Crea un perfil persistente que solo contiene las cookies y el almacenamiento
+    de Instagram, más un user.js con preferencias ligeras. Las cookies se copian
+    de forma segura aunque Firefox esté abierto; para el almacenamiento conviene
+    cerrarlo antes.
+    """
+    if not source or not os.path.isdir(source):
+        raise ValueError(f"No se encontró el perfil de origen en {source}")
+    if os.path.exists(dest) and os.listdir(dest):
+        raise ValueError(f"El directorio {dest} ya existe y no está vacío.")
+    os.makedirs(dest, exist_ok=True)
+
+    cookies_src = os.path.join(source, "cookies.sqlite")
+    if not os.path.exists(cookies_src):
+        raise ValueError(f"El perfil {source} no tiene cookies.sqlite; inicie sesión en Instagram con Firefox primero.")
+    cookies_dest = os.path.join(dest, "cookies.sqlite")
+    _copy_sqlite(cookies_src, cookies_dest)
+    cnxn = sqlite3.connect(cookies_dest)
+    try:
+        condition = " AND ".join("host NOT LIKE ?" for _ in COOKIE_HOST_PATTERNS)
+        removed = cnxn.execute(f"DELETE FROM moz_cookies WHERE {condition}", COOKIE_HOST_PATTERNS).rowcount
+        kept = cnxn.execute("SELECT COUNT(*) FROM moz_cookies").fetchone()[0]
+        cnxn.commit()
+        cnxn.execute("VACUUM")
+    finally:
+        cnxn.close()
+    logger.info("Cookies copiadas: %d conservadas, %d descartadas.", kept, removed)
+
+    for origin in STORAGE_ORIGINS:
+        storage_src = os.path.join(source, "storage", "default", origin)
+        if os.path.isdir(storage_src):
+            shutil.copytree(storage_src, os.path.join(dest, "storage", "default", origin),
+                            ignore=shutil.ignore_patterns("*.sqlite-wal", "*.sqlite-shm", ".metadata-v2-lock"))
+            logger.info("Almacenamiento copiado: %s", origin)
+
+    with open(os.path.join(dest, "user.js"), "w", encoding="utf-8") as f:
+        for name, value in SLIM_PROFILE_PREFS.items():
+            f.write(f'user_pref("{name}", {str(value).lower()});\n')
+
+    logger.info("Perfil reducido creado en %s (%.1f MB).", dest, disk_usage(dest) / 1024 / 1024)
+
+
+def disk_usage(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def benchmark(modes=("copy", "persistent")):
+    """
+    Mide, para cada modo, el tiempo hasta tener el driver creado y hasta cargar
+    el perfil de Instagram, junto con el tamaño en disco del perfil usado.
+    """
+    results = []
+    for mode in modes:
+        profile_path = FIREFOX_PROFILE_PATH if mode == "copy" else FIREFOX_SLIM_PROFILE_PATH
+        started = time.perf_counter()
+        driver = make_driver(mode)
+        driver_ready = time.perf_counter() - started
+        try:
+            loaded = safe_get(driver, f"https://www.instagram.com/{INSTAGRAM_USERNAME}/")
+            first_load = time.perf_counter() - started
+        finally:
+            driver.quit()
+        results.append((mode, driver_ready, first_load if loaded else None, disk_usage(profile_path)))
+
+    print(f"{'Modo':<12}{'Driver (s)':>12}{'1.ª carga (s)':>15}{'Perfil (MB)':>14}")
+    for mode, driver_ready, first_load, size in results:
+        first_load_text = f"{first_load:.1f}" if first_load is not None else "error"
+        print(f"{mode:<12}{driver_ready:>12.1f}{first_load_text:>15}{size / 1024 / 1024:>14.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Herramientas para el perfil de Firefox de Alma.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    create_parser = subparsers.add_parser("create", help="Crea el perfil persistente reducido.")
+    create_parser.add_argument("--source", default=FIREFOX_PROFILE_PATH, help="Perfil de Firefox con la sesión iniciada.")
+    create_parser.add_argument("--dest", default=FIREFOX_SLIM_PROFILE_PATH, help="Directorio del perfil reducido.")
+    benchmark_parser = subparsers.add_parser("benchmark", help="Compara el arranque en modo copy y persistent.")
+    benchmark_parser.add_argument("--modes", nargs="+", default=["copy", "persistent"], choices=["copy", "persistent"])
+    args = parser.parse_args()
+
+    if args.command == "create":
+        create_slim_profile(args.source, args.dest)
+    else:
+        benchmark(args.modes)
@@ -0,0 +1,154 @@
+import os
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+REPORT_WINDOW_SECONDS = int(os.getenv("REPORT_WINDOW_SECONDS", "3600"))
+REPORT_WINDOW_SLOTS = int(os.getenv("REPORT_WINDOW_SLOTS", "12"))
+
+
+def _increment(counter: Dict[str, int], key: str, amount: int = 1):
+    value = counter.get(key, 0) + amount
+    if value:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+
+class _Slot:
+    __slots__ = ("start", "new_by_story")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.new_by_story: Dict[str, int] = {}
+
+
+class RollingWindowAggregator:
+    """
+    Contadores del reporte horario, alimentados con los eventos de nuevos
+    espectadores de todas las historias.
+
+    Los espectadores y usuarios especiales del reporte se acumulan en contadores
+    del periodo, que solo se vacían con start_period al enviar un reporte: así
+    nadie que llegue entre dos reportes se pierde, aunque el reporte se envíe
+    algo más de una hora después del anterior.
+
+    El desglose por historia usa una ventana deslizante dividida en 'slots'
+    intervalos; cada evento suma en el intervalo actual y en los totales, y al
+    caducar un intervalo se restan sus conteos.
+
+    Cada actualización es O(1) por espectador y el reporte sale de los totales
+    sin recorrer el estado ni depender del orden en que se recorrieron las historias.
+    """
+
+    def __init__(self, window_seconds: int = REPORT_WINDOW_SECONDS, slots: int = REPORT_WINDOW_SLOTS):
+        self.window_seconds = window_seconds
+        self.slot_seconds = window_seconds / slots
+        self._slots = deque()
+        # Totales de la ventana (desglose por historia)
+        self.new_by_story: Dict[str, int] = {}
+        # Periodo desde el último reporte
+        self.period_start: Optional[float] = None
+        self.specials: Dict[str, int] = {}
+        self.users: Dict[str, int] = {}
+        self.special_user_names = set()
+        # Último total observado por historia: story_id -> [total, relative_time, timestamp]
+        self.stories: Dict[str, list] = {}
+
+    def _advance(self, now: float):
+        """Caduca los intervalos que ya salieron de la ventana."""
+        while self._slots and self._slots[0].start + self.window_seconds <= now:
+            slot = self._slots.popleft()
+            for story_id, count in slot.new_by_story.items():
+                _increment(self.new_by_story, story_id, -count)
+        for story_id in [s for s, (_, _, seen_at) in self.stories.items() if seen_at + self.window_seconds <= now]:
+            del self.stories[story_id]
+
+    def _current_slot(self, now: float) -> _Slot:
+        self._advance(now)
+        start = now - now % self.slot_seconds
+        if not self._slots or self._slots[-1].start < start:
+            self._slots.append(_Slot(start))
+        return self._slots[-1]
+
+    def observe_story(self, now: float, story_id: str, total_viewers: int, relative_time: str):
+        """Anota el total de espectadores visto en la historia durante este ciclo."""
+        self._advance(now)
+        self.stories[story_id] = [total_viewers, relative_time, now]
+
+    def record_new_viewers(self, now: float, story_id: str, usernames: Iterable[str], special_users: Iterable[str] = ()):
+        slot = self._current_slot(now)
+        specials = set(special_users)
+        self.special_user_names.update(specials)
+        for user in usernames:
+            _increment(slot.new_by_story, story_id)
+            _increment(self.new_by_story, story_id)
+            _increment(self.users, user)
+        for user in specials:
+            _increment(self.specials, user)
+
+    def record_special(self, now: float, user: str):
+        """Cuenta a un usuario especial que reaparece aunque no sea nuevo en la historia."""
+        self._advance(now)
+        self.special_user_names.add(user)
+        _increment(self.specials, user)
+
+    def start_period(self, now: float):
+        """Vacía los contadores del periodo; se llama al enviar un reporte."""
+        self.period_start = now
+        self.specials = {}
+        self.users = {}
+
+    def payload(self, now: float) -> Dict:
+        """
+        Datos del reporte: espectadores y usuarios especiales desde el último
+        start_period, y desglose por historia de la ventana que termina en 'now'.
+        """
+        self._advance(now)
+        # La historia de referencia es la más reciente (los IDs son fechas ISO), no la última recorrida
+        latest_story = max(self.stories) if self.stories else None
+        latest = self.stories.get(latest_story, [0, "N/A", None])
+        return {
+            "story_id": latest_story or "N/A",
+            "relative_time": latest[1],
+            "total_viewers": latest[0],
+            "stories": {
+                story_id: {"total": total, "new": self.new_by_story.get(story_id, 0), "relative_time": relative_time}
+                for story_id, (total, relative_time, _) in sorted(self.stories.items())
+            },
+            "new_viewers": sorted(user for user in self.users if user.lower() not in self.special_user_names),
+            "unique_new_viewers": len(self.users),
+            "special_users": sorted(self.specials),
+        }
+
+    # --- checkpoint (se guarda dentro del estado de ejecución) ---
+    def to_dict(self) -> Dict:
+        """Copia serializable del estado; se puede escribir desde otro hilo."""
+        return {
+            "window_seconds": self.window_seconds,
+            "slot_seconds": self.slot_seconds,
+            "slots": [[slot.start, dict(slot.new_by_story)] for slot in self._slots],
+            "period_start": self.period_start,
+            "specials": dict(self.specials),
+            "users": dict(self.users),
+            "special_user_names": sorted(self.special_user_names),
+            "stories": {story_id: list(story) for story_id, story in self.stories.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RollingWindowAggregator":
+        aggregator = cls()
+        aggregator.period_start = data.get("period_start")
+        aggregator.specials = dict(data.get("specials", {}))
+        aggregator.users = dict(data.get("users", {}))
+        aggregator.special_user_names = set(data.get("special_user_names", []))
+        aggregator.stories = data.get("stories", {})
+        if data.get("window_seconds") != aggregator.window_seconds or data.get("slot_seconds") != aggregator.slot_seconds:
+            # La configuración de la ventana cambió; los intervalos guardados ya no encajan
+            return aggregator
+        for start, new_by_story in data.get("slots", []):
+            slot = _Slot(start)
+            slot.new_by_story = new_by_story
+            aggregator._slots.append(slot)
+            for story_id, count in new_by_story.items():
+                _increment(aggregator.new_by_story, story_id, count)
+        return aggregator
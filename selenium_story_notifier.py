@@ -3,7 +3,6 @@ import time
 import random
 import json
 import logging
-import threading
 import pyodbc
 from typing import Optional
 from dotenv import load_dotenv
@@ -26,8 +25,13 @@ import smtplib
 from datetime import datetime, timedelta
 
 # --- load environment ---
+# Antes de importar los módulos del proyecto: leen su configuración del entorno al importarse
 load_dotenv()
 
+from notifier_logging import setup_logging
+from viewer_timeseries import ViewerTimeSeries, TIMESERIES_FILE
+from viewer_analytics import ViewerAnalytics, ANALYTICS_FILE
+
 SMTP_HOST = os.getenv("SMTP_HOST", "smtp.office365.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
 SMTP_USER = os.getenv("SMTP_USER")
@@ -36,12 +40,19 @@ TO_EMAIL = os.getenv("TO_EMAIL", SMTP_USER)
 
 INSTAGRAM_USERNAME = os.getenv("INSTAGRAM_USERNAME")
 FIREFOX_PROFILE_PATH = os.getenv("FIREFOX_PROFILE_PATH")
+# "copy" copia el perfil en cada arranque; "persistent" abre FIREFOX_SLIM_PROFILE_PATH directamente
+FIREFOX_PROFILE_MODE = os.getenv("FIREFOX_PROFILE_MODE", "copy")
+FIREFOX_SLIM_PROFILE_PATH = os.getenv("FIREFOX_SLIM_PROFILE_PATH", "firefox_profile")
+# Mantiene la página del perfil abierta entre ciclos y solo la recarga si falla la verificación de salud
+WARM_NAVIGATION = os.getenv("WARM_NAVIGATION", "false").lower() in ('true', '1', 't', 'y', 'yes')
 
 POLL_INTERVAL_BASE = int(os.getenv("POLL_INTERVAL_BASE", "300"))
 POLL_INTERVAL_RANDOM_RANGE = int(os.getenv("POLL_INTERVAL_RANDOM_RANGE", "120"))
 RUN_START_HOUR = int(os.getenv("RUN_START_HOUR", "8"))
 RUN_END_HOUR = int(os.getenv("RUN_END_HOUR", "22"))
 STORED_FILE = os.getenv("STORED_FILE", "seen_viewers.json")
+# Estado de ejecución (reporte, usuarios especiales, conteos por historia, planificador) para reanudar en caliente
+RUNTIME_STATE_FILE = os.getenv("RUNTIME_STATE_FILE", "runtime_state.json")
 
 SPECIAL_USERS_STR = os.getenv("SPECIAL_USERS", "")
 SPECIAL_USERS = {user.strip().lower() for user in SPECIAL_USERS_STR.split(',') if user.strip()}
@@ -51,11 +62,17 @@ DB_NAME = os.getenv("DB_NAME", "dbFLDSMDFR")
 ENABLE_DB_LOGGING = os.getenv("ENABLE_DB_LOGGING", "true").lower() in ('true', '1', 't', 'y', 'yes')
 
 # logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+setup_logging()
 logger = logging.getLogger("insta-selenium")
+mail_logger = logger.getChild("mail")
+db_logger = logger.getChild("db")
+keepalive_logger = logger.getChild("keepalive")
 
 # --- helper: smtp email ---
-def send_email(subject: str, body: str, is_html=False):
+def deliver_email(subject: str, body: str, is_html=False, timeout: Optional[float] = None):
+    """Envía el correo y propaga cualquier error (lo usa el EmailSink para sus reintentos)."""
+    if SMTP_USER is None or SMTP_PASS is None:
+        raise ValueError("SMTP_USER y SMTP_PASS deben estar configurados en su archivo .env")
     msg = EmailMessage()
     msg["From"] = SMTP_USER
     msg["To"] = TO_EMAIL
@@ -64,45 +81,65 @@ def send_email(subject: str, body: str, is_html=False):
         msg.add_alternative(body, subtype='html')
     else:
         msg.set_content(body)
-    try:
-        if SMTP_USER is None or SMTP_PASS is None:
-            raise ValueError("SMTP_USER y SMTP_PASS deben estar configurados en su archivo .env")
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
-        logger.info("Correo enviado: %s", subject)
-    except Exception as e:
-        logger.error("Error al enviar el correo: %s", e)
-
-def send_hourly_report_email(new_viewers: list, total_viewers_count: int, special_users_this_hour: list, last_check_time: str, story_id: str, relative_time: str):
+    smtp_kwargs = {} if timeout is None else {"timeout": timeout}
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, **smtp_kwargs) as server:
+        server.starttls()
+        server.login(SMTP_USER, SMTP_PASS)
+        server.send_message(msg)
+    mail_logger.info("Correo enviado: %s", subject)
+
+def build_hourly_report_email(report: dict, last_check_time: str, special_matches: dict, featured_labels: list):
+    """
+    Construye el reporte horario a partir del payload de RollingWindowAggregator.
+    'special_matches' asocia cada usuario especial del reporte con su entrada de
+    la lista de vigilancia; 'featured_labels' son los nombres de las entradas destacadas.
+    """
+    new_viewers = report["new_viewers"]
+    story_id = report["story_id"]
+    relative_time = report["relative_time"]
+    total_viewers_count = report["total_viewers"]
 
     special_alert_html = ""
-    brenda_message_html = ""
+    featured_message_html = ""
 
-    if "branvxvt" in special_users_this_hour:
-        special_alert_html = """
+    featured = [(user, entry) for user, entry in special_matches.items() if entry.featured]
+    if featured:
+        for user, entry in featured:
+            special_alert_html += f"""
             <h3 style="color: red; text-align: center;">🚨 HA VUELTO 🚨</h3>
             <p style="font-size: 1.2em; font-weight: bold; text-align: center;">
-                Se ha detectado la presencia de la mismísima <span style="font-style: italic;">Brenda</span>.
-                Aquello que esperabas ha sucedido, y ella ha decidido "honrar" tu historia con su vista.
+                Se ha detectado la presencia de la mismísima <span style="font-style: italic;">{entry.label_for(user)}</span>.
+                Aquello que esperabas ha sucedido, y ha decidido "honrar" tu historia con su vista.
                 ¿Qué proseguirá ahora? Solo el tiempo lo dirá.
             </p>
         """
-    elif special_users_this_hour:
+    elif special_matches:
         special_alert_html = "<h3 style='color: red; text-align: center;'>🚨 ¡ALERTA! 🚨</h3>"
-        for user in special_users_this_hour:
-            special_alert_html += f"<p style='color: red; font-weight: bold; text-align: center;'>El usuario especial {user} vió tu historia.</p>"
-    else:
-        brenda_message_html = """
+        for user, entry in special_matches.items():
+            special_alert_html += f"<p style='color: red; font-weight: bold; text-align: center;'>El usuario especial {entry.label_for(user)} vió tu historia.</p>"
+    elif featured_labels:
+        featured_message_html = f"""
             <hr style="border-color: #eee;">
             <p style="font-size: 1em; font-style: italic; color: #888; text-align: center;">
-                ...Y aunque la esperanza nunca muere, en esta hora la brújula no ha señalado el Norte. Brenda no ha hecho acto de presencia.
+                ...Y aunque la esperanza nunca muere, en esta hora la brújula no ha señalado el Norte. {' ni '.join(featured_labels)} no ha hecho acto de presencia.
             </p>
             <hr style="border-color: #eee;">
         """
 
+    stories_html = ""
+    if len(report["stories"]) > 1:
+        stories_html = "<h3>Historias activas:</h3><ul>"
+        for other_story_id, story in report["stories"].items():
+            stories_html += f"<li>{other_story_id} (hace {story['relative_time']}): {story['total']} espectadores, {story['new']} nuevos en esta hora</li>"
+        stories_html += "</ul>"
+
     new_viewers_html = ""
+    if new_viewers:
+        new_viewers_html = "<h3>Nuevos espectadores encontrados en esta hora:</h3><ul>"
+        for viewer in new_viewers:
+            new_viewers_html += f"<li>{viewer}</li>"
+        new_viewers_html += "</ul>"
+
     body_html = f"""
     <div style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px; color: #333;">
         <div style="max-width: 600px; margin: auto; background: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1);">
@@ -124,7 +161,8 @@ def send_hourly_report_email(new_viewers: list, total_viewers_count: int, specia
             </div>
 
             {special_alert_html}
-            {brenda_message_html}
+            {featured_message_html}
+            {stories_html}
             {new_viewers_html}
 
             <p style="font-size: 0.8em; color: #aaa; text-align: center; margin-top: 30px;">
@@ -133,53 +171,17 @@ def send_hourly_report_email(new_viewers: list, total_viewers_count: int, specia
         </div>
     </div>
     """
-    if new_viewers:
-        new_viewers_html = "<h3>Nuevos espectadores encontrados en esta hora:</h3><ul>"
-        for viewer in new_viewers:
-            new_viewers_html += f"<li>{viewer}</li>"
-        new_viewers_html += "</ul>"
-        # Insert the new_viewers_html into body_html
-        body_html = f"""
-        <div style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px; color: #333;">
-            <div style="max-width: 600px; margin: auto; background: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1);">
-                <h2 style="text-align: center; color: #555;">📦 Reporte Horario de Alma</h2>
-                <p style="font-size: 0.9em; color: #777; text-align: center;">Última verificación: <strong>{last_check_time}</strong></p>
-                <hr style="border-color: #eee;">
-
-                <div style="text-align: center; margin: 10px 0;">
-                    <p style="font-size: 1em; color: #333;">
-                        Historia ID: <strong>{story_id}</strong><br>
-                        Publicada hace: <strong>{relative_time}</strong>
-                    </p>
-                </div>
-                <hr style="border-color: #eee;">
-
-                <div style="text-align: center;">
-                    <p style="font-size: 1.2em; margin: 0;">Total de espectadores de la historia:</p>
-                    <p style="font-size: 2em; font-weight: bold; color: #007BFF; margin: 5px 0 20px;">{total_viewers_count}</p>
-                </div>
-
-                {special_alert_html}
-                {brenda_message_html}
-                {new_viewers_html}
-
-                <p style="font-size: 0.8em; color: #aaa; text-align: center; margin-top: 30px;">
-                    Este correo fue generado automáticamente por Alma, tu vigilante de Instagram.
-                </p>
-            </div>
-        </div>
-        """
 
-    send_email("Bitácora de Alma 📦: Tu Informe Estelar de la Hora", body_html, is_html=True)
+    return "Bitácora de Alma 📦: Tu Informe Estelar de la Hora", body_html
 
 # --- helper: sql server database ---
-def save_users_and_views(new_viewers: list, story_id: str, total_views: int):
+def save_users_and_views(new_viewers: list, story_id: str, total_views: int, special_users=None):
     """
     Guarda los nuevos usuarios y vistas en las tablas 'StoryUsers' y 'StoryViews'.
     Actualiza el conteo de vistas y la última vez que se vio la historia para cada usuario.
     """
     if not ENABLE_DB_LOGGING or not DB_SERVER or not DB_NAME:
-        logger.warning("La configuración de la base de datos no está completa. No se guardará en SQL Server.")
+        db_logger.warning("La configuración de la base de datos no está completa. No se guardará en SQL Server.")
         return
 
     cnxn = None
@@ -197,7 +199,7 @@ def save_users_and_views(new_viewers: list, story_id: str, total_views: int):
             user_id = None
             if user_row:
                 user_id = user_row[0]
-                logger.info(f"El usuario {viewer} ya existe con el ID {user_id}. Actualizando su conteo de vistas.")
+                db_logger.info("El usuario %s ya existe con el ID %s. Actualizando su conteo de vistas.", viewer, user_id)
 
                 # 2a. Si el usuario existe, actualiza el conteo de vistas y la última fecha de visualización
                 cursor.execute(
@@ -206,7 +208,8 @@ def save_users_and_views(new_viewers: list, story_id: str, total_views: int):
                 )
             else:
                 # 2b. Si el usuario no existe, insértalo en 'StoryUsers' con un conteo inicial de 1
-                is_special = 1 if viewer.lower() in SPECIAL_USERS else 0
+                # 'special_users' viene de la lista de vigilancia; sin ella se usa SPECIAL_USERS
+                is_special = 1 if viewer.lower() in (special_users if special_users is not None else SPECIAL_USERS) else 0
                 cursor.execute(
                     "INSERT INTO StoryUsers (username, is_special, created_at, total_views_count, last_viewed_at) VALUES (?, ?, ?, ?, ?)",
                     viewer, is_special, datetime.now(), 1, datetime.now()
@@ -214,7 +217,7 @@ def save_users_and_views(new_viewers: list, story_id: str, total_views: int):
                 cursor.execute("SELECT @@IDENTITY AS id")
                 user_row = cursor.fetchone()
                 user_id = user_row[0] if user_row is not None else None
-                logger.info(f"Nuevo usuario {viewer} insertado con el ID {user_id}.")
+                db_logger.info("Nuevo usuario %s insertado con el ID %s.", viewer, user_id)
 
             # 3. Inserta la vista en la tabla 'StoryViews'
             if user_id:
@@ -222,44 +225,20 @@ def save_users_and_views(new_viewers: list, story_id: str, total_views: int):
                     "INSERT INTO StoryViews (user_id, story_id, viewed_at, total_views) VALUES (?, ?, ?, ?)",
                     user_id, story_id, datetime.now(), total_views
                 )
-                logger.info(f"La vista de {viewer} para la historia {story_id} ha sido guardada. Vistas totales en ese momento: {total_views}")
+                db_logger.info("La vista de %s para la historia %s ha sido guardada. Vistas totales en ese momento: %d", viewer, story_id, total_views)
 
         cnxn.commit()
 
     except pyodbc.Error as e:
         sqlstate = e.args[0]
-        logger.error(f"Error al conectar o interactuar con la base de datos SQL Server. SQLSTATE: {sqlstate}")
-        logger.error(f"Mensaje de error: {e}")
+        db_logger.error("Error al conectar o interactuar con la base de datos SQL Server. SQLSTATE: %s", sqlstate)
+        db_logger.error("Mensaje de error: %s", e)
     except Exception as e:
-        logger.error(f"Error inesperado al intentar conectar a la base de datos: {e}")
+        db_logger.error("Error inesperado al intentar conectar a la base de datos: %s", e)
     finally:
         if cnxn:
             cnxn.close()
 
-def sleep_with_keepalive(driver, duration_seconds: float, interval_seconds: int = 60):
-    """
-    Duerme durante 'duration_seconds' en intervalos, enviando un comando
-    keep-alive para evitar que la sesión del driver caduque.
-    """
-    logger.info(f"Durmiendo por {duration_seconds:.1f} segundos (con keep-alive)...")
-
-    end_time = time.time() + duration_seconds
-    while time.time() < end_time:
-        sleep_chunk = min(interval_seconds, end_time - time.time())
-        if sleep_chunk <= 0:
-            break
-
-        time.sleep(sleep_chunk)
-
-        try:
-            # Comando inofensivo para mantener la sesión viva
-            _ = driver.title
-            logger.info("Keep-alive enviado al driver.")
-        except Exception as e:
-            logger.warning(f"No se pudo enviar el keep-alive, la conexión puede estar perdida: {e}")
-            # Si la conexión ya está rota, no hay nada que hacer, salimos del bucle.
-            break
-
 # --- storage ---
 def load_seen():
     if os.path.exists(STORED_FILE):
@@ -274,24 +253,88 @@ def save_seen(data):
     with open(STORED_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2, ensure_ascii=False)
 
-# --- Selenium setup ---
-def make_driver():
-    if not FIREFOX_PROFILE_PATH:
-        raise ValueError("FIREFOX_PROFILE_PATH debe estar configurado en su archivo .env")
+def load_timeseries():
+    try:
+        return ViewerTimeSeries.load(TIMESERIES_FILE)
+    except Exception as e:
+        logger.error("No se pudo leer la serie temporal de %s, se empezará una nueva: %s", TIMESERIES_FILE, e)
+        return ViewerTimeSeries()
 
+def save_timeseries(series: ViewerTimeSeries):
     try:
-        profile = FirefoxProfile(FIREFOX_PROFILE_PATH)
+        series.compact()
+        series.save(TIMESERIES_FILE)
     except Exception as e:
-        raise ValueError(f"No se pudo cargar el perfil de Firefox en {FIREFOX_PROFILE_PATH}: {e}") from e
+        logger.error("No se pudo guardar la serie temporal en %s: %s", TIMESERIES_FILE, e)
+
+def load_analytics():
+    try:
+        return ViewerAnalytics.load(ANALYTICS_FILE)
+    except Exception as e:
+        logger.error("No se pudieron leer los agregados de %s, se empezarán unos nuevos: %s", ANALYTICS_FILE, e)
+        return ViewerAnalytics()
+
+def save_analytics(analytics: ViewerAnalytics):
+    if not analytics.dirty:
+        return
+    try:
+        analytics.save(ANALYTICS_FILE)
+    except Exception as e:
+        logger.error("No se pudieron guardar los agregados en %s: %s", ANALYTICS_FILE, e)
+
+def load_runtime_state():
+    if not os.path.exists(RUNTIME_STATE_FILE):
+        return {}
+    try:
+        with open(RUNTIME_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error("No se pudo leer el estado de ejecución de %s, se empezará en frío: %s", RUNTIME_STATE_FILE, e)
+        return {}
+
+def save_runtime_state(state: dict):
+    # Escritura atómica: un corte a mitad de la escritura no deja un archivo truncado
+    tmp_path = f"{RUNTIME_STATE_FILE}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, RUNTIME_STATE_FILE)
+    except Exception as e:
+        logger.error("No se pudo guardar el estado de ejecución en %s: %s", RUNTIME_STATE_FILE, e)
+
+# --- Selenium setup ---
+def make_driver(profile_mode: Optional[str] = None):
+    """
+    Crea la instancia de Firefox en modo headless.
 
+    En modo "copy" Selenium copia FIREFOX_PROFILE_PATH completo a un directorio
+    temporal en cada arranque. En modo "persistent" Firefox abre directamente
+    FIREFOX_SLIM_PROFILE_PATH con -profile, sin copiar nada (ver profile_tool.py
+    para crear ese perfil reducido).
+    """
+    profile_mode = (profile_mode or FIREFOX_PROFILE_MODE).lower()
     options = Options()
-    options.profile = profile
     options.add_argument("--headless")
 
+    if profile_mode == "persistent":
+        if not FIREFOX_SLIM_PROFILE_PATH or not os.path.isdir(FIREFOX_SLIM_PROFILE_PATH):
+            raise ValueError(f"El perfil persistente {FIREFOX_SLIM_PROFILE_PATH} no existe. Créelo con 'python profile_tool.py create'.")
+        options.add_argument("-profile")
+        options.add_argument(os.path.abspath(FIREFOX_SLIM_PROFILE_PATH))
+    elif profile_mode == "copy":
+        if not FIREFOX_PROFILE_PATH:
+            raise ValueError("FIREFOX_PROFILE_PATH debe estar configurado en su archivo .env")
+        try:
+            options.profile = FirefoxProfile(FIREFOX_PROFILE_PATH)
+        except Exception as e:
+            raise ValueError(f"No se pudo cargar el perfil de Firefox en {FIREFOX_PROFILE_PATH}: {e}") from e
+    else:
+        raise ValueError(f"FIREFOX_PROFILE_MODE debe ser 'copy' o 'persistent', no '{profile_mode}'.")
+
     service = FirefoxService(GeckoDriverManager().install())
     driver = webdriver.Firefox(service=service, options=options)
 
-    logger.info("✅ Se ha creado exitosamente la instancia de Firefox en modo headless con el perfil existente.")
+    logger.info("✅ Se ha creado exitosamente la instancia de Firefox en modo headless con el perfil existente (modo %s).", profile_mode)
     return driver
 
 def safe_get(driver, url, retries=5):
@@ -303,22 +346,18 @@ def safe_get(driver, url, retries=5):
             driver.get(url)
             return True
         except WebDriverException as e:
-            logger.warning(f"Intento {i+1} de {retries} fallido. Error: {e.msg}")
+            logger.warning("Intento %d de %d fallido. Error: %s", i + 1, retries, e.msg)
             # Retroceso exponencial: espera 2^i segundos
             sleep_time = 2 ** i
-            logger.info(f"Esperando {sleep_time} segundos antes de reintentar...")
+            logger.info("Esperando %d segundos antes de reintentar...", sleep_time)
             time.sleep(sleep_time)
     logger.error("No se pudo cargar la página después de varios intentos. Saliendo.")
     return False
 
 # --- scraping logic ---
-def open_my_profile(driver):
-    wait = WebDriverWait(driver, 10)
-    if INSTAGRAM_USERNAME:
-        url = f"https://www.instagram.com/{INSTAGRAM_USERNAME}/"
-    else:
-        url = "https://www.instagram.com/"
-    return safe_get(driver, url)
+STORY_RING_XPATH = "//div[@role='button' and .//canvas]"
+
+VIEWERS_BUTTON_XPATH = "//div[@role='button' and .//span[contains(text(), 'Vista por') or contains(text(), 'Viewed by')]]"
 
 def get_story_info(driver):
     try:
@@ -332,8 +371,7 @@ def get_story_info(driver):
 def open_latest_story(driver):
     wait = WebDriverWait(driver, 15)
     try:
-        story_ring_xpath = "//div[@role='button' and .//canvas]"
-        story_ring = wait.until(EC.element_to_be_clickable((By.XPATH, story_ring_xpath)))
+        story_ring = wait.until(EC.element_to_be_clickable((By.XPATH, STORY_RING_XPATH)))
 
         logger.info("Haciendo clic en el círculo de la historia del perfil para abrir la última historia.")
         story_ring.click()
@@ -346,12 +384,23 @@ def open_latest_story(driver):
         logger.error("Error al abrir la historia: %s", e)
         return False
 
+def get_view_count(driver) -> Optional[int]:
+    """
+    Lee el número de espectadores del botón 'Vista por N' sin abrir el panel.
+    Devuelve None si no se puede leer.
+    """
+    try:
+        viewers_button = WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.XPATH, VIEWERS_BUTTON_XPATH)))
+        digits = "".join(ch for ch in viewers_button.text if ch.isdigit())
+        return int(digits) if digits else None
+    except Exception:
+        return None
+
 def fetch_viewers_from_open_story(driver):
     wait = WebDriverWait(driver, 10)
 
     try:
-        viewers_button_xpath = "//div[@role='button' and .//span[contains(text(), 'Vista por') or contains(text(), 'Viewed by')]]"
-        viewers_button = wait.until(EC.element_to_be_clickable((By.XPATH, viewers_button_xpath)))
+        viewers_button = wait.until(EC.element_to_be_clickable((By.XPATH, VIEWERS_BUTTON_XPATH)))
         viewers_button.click()
         time.sleep(2)
 
@@ -411,291 +460,289 @@ def go_to_next_story(driver):
     except NoSuchElementException:
         return False
     except Exception as e:
-        logger.warning(f"No se pudo avanzar a la siguiente historia: {e}")
+        logger.warning("No se pudo avanzar a la siguiente historia: %s", e)
         return False
 
 
-# --- main loop ---
-def main(stop_flag: Optional[threading.Event] = None, update_gui_callback=None):
-    if not SMTP_USER or not SMTP_PASS:
-        raise ValueError("SMTP_USER y SMTP_PASS deben estar configurados en su archivo .env")
+class SeleniumScraper:
+    """
+    Envuelve el driver de Firefox con las operaciones que necesita el orquestador.
+    Todos los métodos son bloqueantes y deben llamarse desde un único hilo.
+    """
+    def __init__(self, warm_navigation: bool = WARM_NAVIGATION):
+        self.driver = None
+        self.warm_navigation = warm_navigation
+        self._page_resident = False
+        self._measure_since = 0
+        self.last_load_metrics = {}
+
+    def start(self):
+        self.driver = make_driver()
+        self._page_resident = False
+
+    def load_profile(self) -> bool:
+        """
+        Deja el perfil listo para abrir la historia. En modo cálido, si la página
+        sigue abierta, cierra el visor y refresca la bandeja con la navegación
+        interna de Instagram; solo recarga la página completa si la verificación
+        de salud falla. Mide el peso transferido y el tiempo hasta el anillo de historia.
+        """
+        started = time.perf_counter()
+        mode = "cálida"
+        if not (self.warm_navigation and self._page_resident and self._warm_navigate()):
+            mode = "completa"
+            self._page_resident = False
+            if not safe_get(self.driver, f"https://www.instagram.com/{INSTAGRAM_USERNAME}/"):
+                return False
+            # El búfer es por documento: tras una recarga vuelve al valor por defecto (250 entradas)
+            self._prepare_resource_timing()
+            self._measure_since = 0
+        self._page_resident = self.warm_navigation
+
+        ring_seconds = None
+        try:
+            WebDriverWait(self.driver, 10).until(EC.element_to_be_clickable((By.XPATH, STORY_RING_XPATH)))
+            ring_seconds = time.perf_counter() - started
+        except TimeoutException:
+            pass
+
+        transferred, complete = self._transferred_bytes()
+        # El orquestador lo envía a la GUI junto con cada muestra
+        self.last_load_metrics = {"mode": mode, "bytes": transferred, "ring_seconds": ring_seconds, "complete": complete}
+        logger.info(
+            "Carga %s del perfil: %s%.1f KB transferidos, anillo de historia en %s.",
+            mode, "" if complete else "al menos ", transferred / 1024,
+            f"{ring_seconds:.2f} s" if ring_seconds is not None else "N/A",
+        )
+        return True
 
-    seen = load_seen()
-    special_user_seen_status = {user: user in seen.get('all_viewers', []) for user in SPECIAL_USERS}
-    story_id = None
-    current_story_viewers = []
-    relative_time = "N/A"
+    def _warm_navigate(self) -> bool:
+        try:
+            self._prepare_resource_timing()
+            self._measure_since = self.driver.execute_script("return performance.now();")
 
-    driver = None
-    try:
-        driver = make_driver()
-    except WebDriverException as e:
-        logger.error("Error al iniciar el controlador de Firefox: %s", e)
-        return
-    except ValueError as e:
-        logger.error("Error de configuración: %s", e)
-        return
+            # 1. Cerrar el visor de historias con Escape y, si sigue abierto, con el historial
+            self.driver.switch_to.active_element.send_keys(Keys.ESCAPE)
+            try:
+                WebDriverWait(self.driver, 3).until(lambda d: "/stories/" not in d.current_url)
+            except TimeoutException:
+                self.driver.back()
+
+            # 2. Refrescar la bandeja de historias con la navegación interna de la aplicación
+            profile_path = f"/{INSTAGRAM_USERNAME}/"
+            links = self.driver.find_elements(By.CSS_SELECTOR, f"a[href='{profile_path}']")
+            if links:
+                self.driver.execute_script("arguments[0].click();", links[0])
+            else:
+                self.driver.execute_script(
+                    "window.history.pushState({}, '', arguments[0]);"
+                    "window.dispatchEvent(new PopStateEvent('popstate'));",
+                    profile_path,
+                )
+
+            # 3. Verificación de salud: documento completo, ruta del perfil y cabecera renderizada
+            WebDriverWait(self.driver, 10).until(
+                lambda d: d.execute_script("return document.readyState") == "complete"
+                and d.current_url.rstrip("/").endswith(f"instagram.com/{INSTAGRAM_USERNAME}")
+                and d.find_elements(By.TAG_NAME, "header")
+            )
+            return True
+        except Exception as e:
+            logger.warning("La navegación cálida falló (%s); se recargará la página completa.", e)
+            return False
+
+    def _prepare_resource_timing(self):
+        """
+        Amplía el búfer de tiempos de recursos y anota si se llenó. En una recarga
+        completa se llama ya con la página cargada: si la carga superó el búfer por
+        defecto, las entradas perdidas no se recuperan y la medida queda incompleta.
+        """
+        try:
+            self.driver.execute_script(
+                "window.__almaTimingOverflow = performance.getEntriesByType('resource').length >= 250;"
+                "performance.setResourceTimingBufferSize(2000);"
+                "if (!window.__almaTimingListener) {"
+                "  window.__almaTimingListener = true;"
+                "  performance.addEventListener('resourcetimingbufferfull', () => { window.__almaTimingOverflow = true; });"
+                "}"
+            )
+        except Exception:
+            pass
+
+    def _transferred_bytes(self) -> tuple:
+        """
+        Bytes transferidos desde el inicio de la carga y si la medida está completa;
+        vacía el búfer de tiempos de recursos.
+        """
+        try:
+            total, overflow = self.driver.execute_script(
+                "const since = arguments[0];"
+                "const entries = performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'));"
+                "const total = entries.filter(e => e.startTime >= since).reduce((sum, e) => sum + (e.transferSize || 0), 0);"
+                "const overflow = !!window.__almaTimingOverflow;"
+                "window.__almaTimingOverflow = false;"
+                "performance.clearResourceTimings();"
+                "return [total, overflow];",
+                self._measure_since,
+            )
+            return int(total or 0), not overflow
+        except Exception:
+            return 0, False
 
-    last_report_time = datetime.now()
-    new_viewers_this_hour = set()
-    new_special_users_this_hour = set()
+    def open_latest_story(self) -> bool:
+        return open_latest_story(self.driver)
 
+    def get_story_info(self):
+        return get_story_info(self.driver)
+
+    def get_view_count(self) -> Optional[int]:
+        return get_view_count(self.driver)
+
+    def fetch_viewers(self) -> list:
+        return fetch_viewers_from_open_story(self.driver)
+
+    def next_story(self) -> bool:
+        return go_to_next_story(self.driver)
+
+    def keepalive(self):
+        # Comando inofensivo para mantener la sesión viva
+        return self.driver.title
+
+    def quit(self):
+        if self.driver:
+            self.driver.quit()
+
+# --- notification content ---
+def build_new_viewers_email(new_viewers, special_matches: dict, story_id: str, relative_time: str):
+    """
+    Construye el asunto y el cuerpo HTML del aviso de nuevos espectadores de una historia.
+    'special_matches' asocia cada usuario especial nuevo con su entrada de la lista de vigilancia.
+    """
+    subject = "Nuevos Espectadores de Historias"
+    relative_hours = None
     try:
-        if not open_my_profile(driver):
-            return
+        relative_hours_str = relative_time.split(" ")[0]
+        if relative_hours_str.isdigit():
+            relative_hours = int(relative_hours_str)
+    except Exception:
+        pass
+
+    # Las entradas de mayor prioridad primero, para el asunto y el orden de los mensajes
+    matches = sorted(special_matches.items(), key=lambda item: (item[1].priority, item[0]))
+    featured = [(user, entry) for user, entry in matches if entry.featured]
+    others = [(user, entry) for user, entry in matches if not entry.featured]
+
+    special_message_html = ""
+    for user, entry in featured:
+        special_message_html += entry.render_message(user) or f"""
+            <h3 style="color: #6a1b9a; text-align: center;">🌌 El Universo ha Conspirado 🌌</h3>
+            <p style="font-size: 1.2em; font-weight: bold; text-align: center; color: #4a148c;">
+                ¡Una aparición digna de las estrellas! <span style="font-style: italic; color: #8e24aa;">{entry.label_for(user)}</span> ha hecho acto de presencia.
+                Un simple vistazo, pero, ¿qué significa para ti? ¿Qué significa en realidad?.
+            </p>
+            <hr style="border-color: #e1bee7;">
+        """
 
-        while True:
-            current_time = datetime.now()
-            current_hour = current_time.hour
-            is_in_range = False
+    if featured and others:
+        subject = f"🚨 ALERTA DE USUARIOS ESPECIALES: ¡{featured[0][1].label_for(featured[0][0])} y otros han visto tu historia!"
+    elif featured:
+        subject = f"🚨 HA VUELTO: ¡{' y '.join(entry.label_for(user) for user, entry in featured)} acaba de ver tu historia!"
+    elif others:
+        # Un asunto más elegante si solo son otros usuarios
+        user_list = ', '.join(entry.label_for(user) for user, entry in others)
+        subject = f"Visita Notable: {user_list} ha visto tu historia"
+    # Un asunto propio de la entrada de mayor prioridad tiene precedencia
+    for user, entry in matches:
+        custom_subject = entry.render_subject(user)
+        if custom_subject:
+            subject = custom_subject
+            break
 
-            if RUN_START_HOUR <= RUN_END_HOUR:
-                if RUN_START_HOUR <= current_hour < RUN_END_HOUR:
-                    is_in_range = True
-            else:
-                if current_hour >= RUN_START_HOUR or current_hour < RUN_END_HOUR:
-                    is_in_range = True
+    # Construimos un cuerpo de mensaje más estilizado
+    other_special_users_html = ""
+    if others:
+        other_special_users_html = "<hr style='border-color: #ddd;'>"
+        for user, entry in others:
+            other_special_users_html += entry.render_message(user) or f"""
+            <div style="margin-top: 15px; padding: 10px; border-left: 3px solid #FFC107;">
+                <h4 style="margin: 0; color: #555;">✨ Presencia Notable Detectada</h4>
+                <p style="margin: 5px 0 0; font-size: 1.1em;">
+                    El rastro de <strong>{entry.label_for(user)}</strong> ha cruzado la órbita de tu historia más reciente.
+                </p>
+            </div>
+            """
+        other_special_users_html += "<hr style='border-color: #ddd; margin-top: 15px;'>"
 
-            if not is_in_range:
-                logger.info("Fuera del horario de ejecución (%d:00 - %d:00). Durmiendo hasta la próxima hora de inicio.", RUN_START_HOUR, RUN_END_HOUR)
+    body_html = f"""
+    <div style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px; color: #333;">
+        <div style="max-width: 600px; margin: auto; background: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1);">
+            <h2 style="text-align: center; color: #555;">🚀 ¡Nuevos Espectadores de Historias de Instagram!</h2>
+            <hr style="border-color: #eee;">
 
-                if current_hour < RUN_START_HOUR:
-                    time_to_wait = (RUN_START_HOUR - current_hour) * 3600
-                else:
-                    time_to_wait = ((24 - current_hour) + RUN_START_HOUR) * 3600
+            <p style="font-size: 0.9em; color: #777; text-align: center;">
+                Esta historia fue publicada hace {relative_time}.
+            </p>
 
-                time.sleep(time_to_wait)
-                continue
+            <p style="font-size: 1em; text-align: center; color: #555;">
+                Historia ID: <strong>{story_id}</strong>
+            </p>
+            <hr style="border-color: #eee;">
 
-            if stop_flag and stop_flag.is_set():
-                logger.info("Bandera de detención detectada. Saliendo del bucle principal.")
-                break
+            {"<p style='color: orange; font-weight: bold; text-align: center;'>⚠️ ¡Esta historia está a punto de caducar!</p>" if relative_hours is not None and relative_hours >= 23 else ""}
 
-            if (current_time - last_report_time) >= timedelta(hours=1):
-                logger.info("Enviando reporte horario...")
-                total_viewers_for_report = len(current_story_viewers)
-                special_users_in_story = {v for v in current_story_viewers if v.lower() in SPECIAL_USERS}
-
-                send_hourly_report_email(
-                    list(new_viewers_this_hour),
-                    total_viewers_for_report,
-                    list(special_users_in_story),
-                    current_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    story_id if story_id is not None else "N/A",
-                    relative_time
-                )
+            {special_message_html}
 
-                last_report_time = current_time
-                new_viewers_this_hour = set()
-                new_special_users_this_hour = set()
-
-            logger.info("Comprobando nuevos espectadores de historias...")
-
-            if not safe_get(driver, f"https://www.instagram.com/{INSTAGRAM_USERNAME}/"):
-                continue
-
-            time.sleep(5)
-
-            ok = open_latest_story(driver)
-            if not ok:
-                logger.warning("No se pudo abrir la historia en este momento. Se reintentará más tarde.")
-                story_id = None
-                if update_gui_callback:
-                    update_gui_callback(
-                        last_check_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        total_viewers="N/A",
-                        story_age="N/A"
-                    )
-
-                time.sleep(POLL_INTERVAL_BASE + random.uniform(0, POLL_INTERVAL_RANDOM_RANGE))
-                continue
-
-            # 🔹 recorrer TODAS las historias
-            has_more_stories = True
-            all_viewers_this_cycle = set()
-            while has_more_stories:
-                relative_time, story_id = get_story_info(driver)
-                if not story_id:
-                    logger.warning("No se pudo obtener un ID único para la historia. Pasando a la siguiente.")
-                    has_more_stories = go_to_next_story(driver)
-                    continue
-
-                viewers = fetch_viewers_from_open_story(driver)
-                all_viewers_this_cycle.update(viewers) # <--- AÑADE ESTA LÍNEA
-                current_story_viewers = viewers
-                total_views = len(viewers)
-
-                if update_gui_callback:
-                    update_gui_callback(
-                        last_check_time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        total_viewers=total_views,
-                        story_age=relative_time
-                    )
-
-                if story_id not in seen:
-                    seen[story_id] = []
-                    logger.info("Nueva historia detectada con ID: %s", story_id)
-
-                prev = set(seen.get(story_id, []))
-                new = set(viewers) - prev
-
-                lowercase_viewers = {v.lower() for v in viewers}
-
-                # for user in SPECIAL_USERS:
-                #     if user in special_user_seen_status and special_user_seen_status[user] and user not in lowercase_viewers:
-                #         logger.warning(f"El usuario especial {user} ya no está en la lista de espectadores.")
-                #         subject = f"🚨 ADVERTENCIA: {user} podría haberte bloqueado."
-                #         body = f"Parece que **{user}** ya no está en la lista de espectadores de tu historia. Es posible que te haya bloqueado o restringido."
-                #         send_email(subject, body, is_html=True)
-                #         special_user_seen_status[user] = False
-                #     elif user not in special_user_seen_status or (user in lowercase_viewers and not special_user_seen_status[user]):
-                #         special_user_seen_status[user] = True
-                #         new_special_users_this_hour.add(user)
-
-                if new:
-                    logger.info("Se han detectado nuevos espectadores: %s", new)
-                    new_special_users_in_check = {user for user in SPECIAL_USERS if user in {v.lower() for v in new}}
-
-                    subject = "Nuevos Espectadores de Historias"
-                    relative_hours = None
-                    try:
-                        relative_hours_str = relative_time.split(" ")[0]
-                        if relative_hours_str.isdigit():
-                            relative_hours = int(relative_hours_str)
-                    except Exception:
-                        pass
-
-                    special_message_html = ""
-                    if "branvxvt" in new_special_users_in_check:
-                        subject = "🚨 HA VUELTO: ¡Brenda acaba de ver tu historia!"
-                        special_message_html = f"""
-                            <h3 style="color: #6a1b9a; text-align: center;">🌌 El Universo ha Conspirado 🌌</h3>
-                            <p style="font-size: 1.2em; font-weight: bold; text-align: center; color: #4a148c;">
-                                ¡Una aparición digna de las estrellas! <span style="font-style: italic; color: #8e24aa;">Brenda</span> ha hecho acto de presencia.
-                                Un simple vistazo, pero, ¿qué significa para ti? ¿Qué significa en realidad?.
-                            </p>
-                            <hr style="border-color: #e1bee7;">
-                        """
-
-                    other_special_users_html = ""
-                    if len(new_special_users_in_check) > 1 or ("branvxvt" not in new_special_users_in_check and new_special_users_in_check):
-                        if "branvxvt" in new_special_users_in_check:
-                            subject = f"🚨 ALERTA DE USUARIOS ESPECIALES: ¡Brenda y otros han visto tu historia!"
-                        else:
-                            # Un asunto más elegante si solo son otros usuarios
-                            user_list = ', '.join(new_special_users_in_check)
-                            subject = f"Visita Notable: {user_list} ha visto tu historia"
-
-                    # Construimos un cuerpo de mensaje más estilizado
-                    other_special_users_html = "<hr style='border-color: #ddd;'>"
-                    for user in new_special_users_in_check:
-                        if user != "branvxvt": # Nos aseguramos de no duplicar el mensaje de Brenda
-                            other_special_users_html += f"""
-                            <div style="margin-top: 15px; padding: 10px; border-left: 3px solid #FFC107;">
-                                <h4 style="margin: 0; color: #555;">✨ Presencia Notable Detectada</h4>
-                                <p style="margin: 5px 0 0; font-size: 1.1em;">
-                                    El rastro de <strong>{user}</strong> ha cruzado la órbita de tu historia más reciente.
-                                </p>
-                            </div>
-                            """
-                    other_special_users_html += "<hr style='border-color: #ddd; margin-top: 15px;'>"
-
-                    body_html = f"""
-                    <div style="font-family: Arial, sans-serif; background-color: #f4f4f4; padding: 20px; color: #333;">
-                        <div style="max-width: 600px; margin: auto; background: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1);">
-                            <h2 style="text-align: center; color: #555;">🚀 ¡Nuevos Espectadores de Historias de Instagram!</h2>
-                            <hr style="border-color: #eee;">
-
-                            <p style="font-size: 0.9em; color: #777; text-align: center;">
-                                Esta historia fue publicada hace {relative_time}.
-                            </p>
-
-                            <p style="font-size: 1em; text-align: center; color: #555;">
-                                Historia ID: <strong>{story_id}</strong>
-                            </p>
-                            <hr style="border-color: #eee;">
-
-                            {"<p style='color: orange; font-weight: bold; text-align: center;'>⚠️ ¡Esta historia está a punto de caducar!</p>" if relative_hours is not None and relative_hours >= 23 else ""}
-
-                            {special_message_html}
-
-                            {other_special_users_html}
-
-                            <h3>Nuevos Espectadores:</h3>
-                            <ul>
-                                {''.join([f"<li>{viewer}</li>" for viewer in new])}
-                            </ul>
-                        </div>
-                    </div>
-                    """
-
-                    send_email(subject, body_html, is_html=True)
-
-                    seen[story_id] = sorted(list(set(viewers) | prev))
-                    save_seen(seen)
-
-                    if ENABLE_DB_LOGGING:
-                        save_users_and_views(list(new), story_id, total_views)
-
-                    new_viewers_this_hour.update(new - new_special_users_in_check)
-
-                else:
-                    logger.info("No se encontraron nuevos espectadores en esta revisión. Total de espectadores: %d", total_views)
-
-                # Intentar pasar a la siguiente historia
-                has_more_stories = go_to_next_story(driver)
-
-            # --- NUEVA LÓGICA DE VERIFICACIÓN DE BLOQUEO ---
-            # Se ejecuta después de haber revisado TODAS las historias
-            lowercase_all_viewers = {v.lower() for v in all_viewers_this_cycle}
-            for user in SPECIAL_USERS:
-                is_currently_viewing = user in lowercase_all_viewers
-                was_previously_viewing = special_user_seen_status.get(user, False)
-
-                if was_previously_viewing and not is_currently_viewing:
-                    # Estaba viendo, pero ahora no aparece en NINGUNA historia
-                    # Reemplaza el bloque de envío de correo en tu nueva lógica de bloqueo
-                    subject = f"🚨 Anomalía Detectada: Se ha perdido el rastro de {user}"
-                    body = f"""
-                    <div style="font-family: Arial, sans-serif; text-align: center; background-color: #f4f4f4; padding: 20px; color: #333;">
-                        <div style="max-width: 600px; margin: auto; background: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1);">
-                            <h2 style="color: #d32f2f;">🌌 Silencio en el Cosmos 🌌</h2>
-                            <hr style="border-color: #eee;">
-                            <p style="font-size: 1.1em; color: #555;">
-                                En mi última vigilia, he barrido el firmamento de tus historias activas y no he podido encontrar la señal de <strong>{user}</strong>.
-                            </p>
-                            <p style="font-size: 1em; font-style: italic; color: #777;">
-                                Su luz, que antes estaba presente, se ha desvanecido del espectro visible.
-                            </p>
-                            <p style="font-size: 1em; color: #555;">
-                                Esto podría ser una simple nube pasajera, o podría significar que su telescopio ya no apunta en tu dirección. Permanezco en alerta.
-                            </p>
-                        </div>
-                    </div>
-                    """
-                    send_email(subject, body, is_html=True)
-                    special_user_seen_status[user] = False
-                elif is_currently_viewing:
-                    # Si está viendo, nos aseguramos de que su estado sea True
-                    if not was_previously_viewing:
-                         new_special_users_this_hour.add(user) # Contabiliza para reporte horario si es un "regreso"
-                    special_user_seen_status[user] = True
-            # --- FIN DE LA NUEVA LÓGICA ---
-
-            sleep_for = POLL_INTERVAL_BASE + random.uniform(0, POLL_INTERVAL_RANDOM_RANGE)
-            # logger.info("Durmiendo por %.1f segundos.", sleep_for)
-            sleep_with_keepalive(driver, sleep_for)
-
-    except KeyboardInterrupt:
-        logger.info("Interrumpido por el usuario.")
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception:
-                pass
-        save_seen(seen)
-        logger.info("Saliendo.")
-
-if __name__ == "__main__":
-    main()
+            {other_special_users_html}
+
+            <h3>Nuevos Espectadores:</h3>
+            <ul>
+                {''.join([f"<li>{viewer}</li>" for viewer in new_viewers])}
+            </ul>
+        </div>
+    </div>
+    """
+    return subject, body_html
+
+def build_lost_track_email(user: str, entry):
+    """
+    Construye el aviso de que un usuario especial ya no aparece en ninguna historia activa.
+    'entry' es su entrada de la lista de vigilancia; sus plantillas tienen precedencia.
+    """
+    label = entry.label_for(user)
+    subject = entry.render_lost_subject(user) or f"🚨 Anomalía Detectada: Se ha perdido el rastro de {label}"
+    body = entry.render_lost_message(user) or f"""
+    <div style="font-family: Arial, sans-serif; text-align: center; background-color: #f4f4f4; padding: 20px; color: #333;">
+        <div style="max-width: 600px; margin: auto; background: #fff; padding: 20px; border-radius: 8px; box-shadow: 0 0 10px rgba(0,0,0,0.1);">
+            <h2 style="color: #d32f2f;">🌌 Silencio en el Cosmos 🌌</h2>
+            <hr style="border-color: #eee;">
+            <p style="font-size: 1.1em; color: #555;">
+                En mi última vigilia, he barrido el firmamento de tus historias activas y no he podido encontrar la señal de <strong>{label}</strong>.
+            </p>
+            <p style="font-size: 1em; font-style: italic; color: #777;">
+                Su luz, que antes estaba presente, se ha desvanecido del espectro visible.
+            </p>
+            <p style="font-size: 1em; color: #555;">
+                Esto podría ser una simple nube pasajera, o podría significar que su telescopio ya no apunta en tu dirección. Permanezco en alerta.
+            </p>
+        </div>
+    </div>
+    """
+    return subject, body
+
+# --- scheduling ---
+def is_in_run_window(hour: int) -> bool:
+    """Indica si la hora cae dentro del horario de ejecución, incluso si cruza la medianoche."""
+    if RUN_START_HOUR <= RUN_END_HOUR:
+        return RUN_START_HOUR <= hour < RUN_END_HOUR
+    return hour >= RUN_START_HOUR or hour < RUN_END_HOUR
+
+def seconds_until_run_window(now: datetime) -> float:
+    """Segundos que faltan desde 'now' hasta la próxima hora de inicio."""
+    next_start = now.replace(hour=RUN_START_HOUR, minute=0, second=0, microsecond=0)
+    if next_start <= now:
+        next_start += timedelta(days=1)
+    return (next_start - now).total_seconds()
+
+def next_poll_interval(rng=random) -> float:
+    """'rng' permite inyectar un random.Random sembrado (p. ej. en la simulación)."""
+    return POLL_INTERVAL_BASE + rng.uniform(0, POLL_INTERVAL_RANDOM_RANGE)
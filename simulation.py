@@ -0,0 +1,247 @@
+import asyncio
+import argparse
+import logging
+import random
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from orchestrator import StoryOrchestrator
+from notification_sinks import NotificationDispatcher, NotificationSink
+from selenium_story_notifier import SPECIAL_USERS
+from viewer_timeseries import ViewerTimeSeries
+from viewer_analytics import ViewerAnalytics
+
+logger = logging.getLogger("insta-selenium.simulation")
+
+STORY_LIFETIME = timedelta(hours=24)
+
+
+class VirtualClock:
+    """
+    Reloj virtual: 'sleep' adelanta la hora simulada en lugar de esperar.
+    Al alcanzar 'end' llama a 'on_deadline' una sola vez.
+    """
+
+    def __init__(self, start: datetime, end: datetime):
+        self._now = start
+        self.end = end
+        self.on_deadline = None
+        self._lock = threading.Lock()
+
+    def now(self) -> datetime:
+        with self._lock:
+            return self._now
+
+    def advance(self, seconds: float):
+        with self._lock:
+            self._now += timedelta(seconds=max(seconds, 0))
+            reached = self._now >= self.end
+        if reached and self.on_deadline:
+            callback, self.on_deadline = self.on_deadline, None
+            callback()
+
+    async def sleep(self, seconds: float, stop_event: asyncio.Event):
+        if stop_event.is_set():
+            return
+        self.advance(seconds)
+        # Cede el control para que los consumidores avancen entre ciclos simulados
+        await asyncio.sleep(0)
+
+
+class ScriptedStory:
+    def __init__(self, posted_at: datetime, arrivals: List[tuple]):
+        self.posted_at = posted_at
+        self.story_id = posted_at.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        # (instante, usuario) ordenados por instante
+        self.arrivals = sorted(arrivals)
+        self._arrival_times = [when for when, _ in self.arrivals]
+
+    def viewers_at(self, now: datetime, departed: Dict[str, datetime]) -> List[str]:
+        count = bisect_right(self._arrival_times, now)
+        return sorted(
+            user for _, user in self.arrivals[:count]
+            if user not in departed or now < departed[user]
+        )
+
+
+class ScriptedScraper:
+    """
+    Sustituto guionizado de SeleniumScraper: responde con las historias activas
+    y los espectadores que el guion indica para la hora del reloj virtual.
+    """
+
+    def __init__(self, clock: VirtualClock, stories: List[ScriptedStory], departed: Dict[str, datetime], counters):
+        self.clock = clock
+        self.stories = sorted(stories, key=lambda story: story.posted_at)
+        self.departed = departed
+        self.counters = counters
+        self._active: List[ScriptedStory] = []
+        self._cursor = 0
+        self.last_load_metrics = {}
+
+    def start(self):
+        pass
+
+    def load_profile(self) -> bool:
+        self.counters.add("page_loads")
+        return True
+
+    def open_latest_story(self) -> bool:
+        now = self.clock.now()
+        self._active = [s for s in self.stories if s.posted_at <= now < s.posted_at + STORY_LIFETIME]
+        self._cursor = 0
+        return bool(self._active)
+
+    def get_story_info(self):
+        story = self._active[self._cursor]
+        hours = int((self.clock.now() - story.posted_at).total_seconds() // 3600)
+        return f"{hours} h", story.story_id
+
+    def get_view_count(self) -> int:
+        return len(self.fetch_viewers())
+
+    def fetch_viewers(self) -> list:
+        return self._active[self._cursor].viewers_at(self.clock.now(), self.departed)
+
+    def next_story(self) -> bool:
+        self._cursor += 1
+        return self._cursor < len(self._active)
+
+    def keepalive(self):
+        return "Instagram"
+
+    def quit(self):
+        pass
+
+
+class CountingSink(NotificationSink):
+    """Canal que sustituye al correo y solo cuenta los avisos."""
+
+    name = "counting"
+
+    def __init__(self, counters):
+        super().__init__()
+        self.counters = counters
+
+    def send(self, event):
+        self.counters.add("emails")
+
+
+class SimulationCounters:
+    """Conteos por día simulado."""
+
+    FIELDS = ("emails", "db_writes", "db_rows", "page_loads", "json_saves")
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self.by_day = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+        self._lock = threading.Lock()
+
+    def add(self, field: str, amount: int = 1):
+        with self._lock:
+            self.by_day[self.clock.now().date()][field] += amount
+
+
+def build_scenario(start: datetime, days: int, rng: random.Random, audience: int = 150):
+    """
+    Genera un guion: de una a tres historias por día, espectadores que llegan
+    con un retraso exponencial y usuarios especiales que ven algunas historias.
+    A mitad de la simulación el primer usuario especial deja de aparecer, para
+    ejercitar el aviso de "rastro perdido".
+    """
+    users = [f"viewer_{i:03d}" for i in range(audience)]
+    special = sorted(SPECIAL_USERS)
+    stories = []
+    for day in range(days):
+        day_start = start + timedelta(days=day)
+        for hour in sorted(rng.sample(range(12, 24), rng.randint(1, 3))):
+            posted_at = day_start + timedelta(hours=hour, minutes=rng.randint(0, 59))
+            arrivals = []
+            for user in users + special:
+                probability = 0.7 if user in special else 0.4
+                if rng.random() < probability:
+                    delay = min(rng.expovariate(1 / 7200), STORY_LIFETIME.total_seconds() - 1)
+                    arrivals.append((posted_at + timedelta(seconds=delay), user))
+            stories.append(ScriptedStory(posted_at, arrivals))
+
+    departed = {}
+    if special:
+        departed[special[0]] = start + timedelta(days=days / 2)
+    return stories, departed
+
+
+def run_simulation(days: int = 1, start: Optional[datetime] = None, seed: int = 0, audience: int = 150):
+    """
+    Reproduce 'days' días de vigilia con reloj virtual y devuelve los conteos por día.
+    """
+    start = start or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    rng = random.Random(seed)
+
+    clock = VirtualClock(start, start + timedelta(days=days))
+    counters = SimulationCounters(clock)
+    stories, departed = build_scenario(start, days, rng, audience)
+    scraper = ScriptedScraper(clock, stories, departed, counters)
+
+    def views_writer(new_viewers, story_id, total_views, special_users=None):
+        counters.add("db_writes")
+        counters.add("db_rows", len(new_viewers))
+
+    def seen_saver(data):
+        counters.add("json_saves")
+
+    orchestrator = StoryOrchestrator(
+        clock=clock,
+        scraper=scraper,
+        dispatcher=NotificationDispatcher([CountingSink(counters)], retries=1),
+        views_writer=views_writer,
+        seen_loader=dict,
+        seen_saver=seen_saver,
+        timeseries_loader=ViewerTimeSeries,
+        timeseries_saver=lambda series: None,
+        analytics_loader=ViewerAnalytics,
+        analytics_saver=lambda analytics: None,
+        checkpoint_loader=dict,
+        checkpoint_saver=lambda state: None,
+        # Generador propio y sembrado para la espera entre ciclos, así la corrida es reproducible
+        rng=random.Random(seed),
+    )
+    clock.on_deadline = orchestrator.stop
+    asyncio.run(orchestrator.run())
+    return dict(sorted(counters.by_day.items()))
+
+
+def format_report(by_day) -> str:
+    header = f"{'Día':<12}{'Correos':>10}{'Escrit. BD':>12}{'Filas BD':>10}{'Cargas':>10}{'JSON':>8}"
+    lines = [header, "-" * len(header)]
+    totals = dict.fromkeys(SimulationCounters.FIELDS, 0)
+    for day, counts in by_day.items():
+        lines.append(
+            f"{day.isoformat():<12}{counts['emails']:>10}{counts['db_writes']:>12}"
+            f"{counts['db_rows']:>10}{counts['page_loads']:>10}{counts['json_saves']:>8}"
+        )
+        for field in totals:
+            totals[field] += counts[field]
+    lines.append("-" * len(header))
+    lines.append(
+        f"{'Total':<12}{totals['emails']:>10}{totals['db_writes']:>12}"
+        f"{totals['db_rows']:>10}{totals['page_loads']:>10}{totals['json_saves']:>8}"
+    )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simula días completos de vigilia con un reloj virtual.")
+    parser.add_argument("--days", type=int, default=1, help="Días simulados.")
+    parser.add_argument("--start", type=lambda value: datetime.strptime(value, "%Y-%m-%d"), default=None, help="Fecha de inicio (AAAA-MM-DD).")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla del guion.")
+    parser.add_argument("--audience", type=int, default=150, help="Número de espectadores posibles.")
+    parser.add_argument("--verbose", action="store_true", help="Muestra los registros de la vigilia simulada.")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger("insta-selenium").setLevel(logging.WARNING)
+
+    print(format_report(run_simulation(args.days, args.start, args.seed, args.audience)))
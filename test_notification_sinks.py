@@ -0,0 +1,124 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from notification_sinks import (
+    NOTIFY_BREAKER_THRESHOLD,
+    CircuitBreaker,
+    PRIORITY_NORMAL,
+    NotificationDispatcher,
+    NotificationEvent,
+    NotificationSink,
+    WebhookSink,
+)
+
+
+class _Recorder(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(json.loads(body))
+        self.send_response(self.server.status)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def webhook_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Recorder)
+    server.requests = []
+    server.status = 200
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/hook"
+
+
+def _event(subject="Nuevos Espectadores de Historias"):
+    return NotificationEvent("new_viewers", subject, "<p>html</p>", PRIORITY_NORMAL, {"story_id": "s1", "viewers": ["ana", "bob"]})
+
+
+class _BlockingSink(NotificationSink):
+    name = "blocking"
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.received = []
+
+    def send(self, event):
+        self.release.wait(10)
+        self.received.append(event.subject)
+
+
+def test_webhook_posts_event_as_json(webhook_server):
+    WebhookSink(_url(webhook_server)).send(_event())
+
+    assert len(webhook_server.requests) == 1
+    payload = webhook_server.requests[0]
+    assert payload["kind"] == "new_viewers"
+    assert payload["subject"] == "Nuevos Espectadores de Historias"
+    assert payload["priority"] == "normal"
+    assert payload["data"] == {"story_id": "s1", "viewers": ["ana", "bob"]}
+    assert "html" not in payload
+
+
+def test_slow_sink_does_not_delay_others(webhook_server):
+    blocking = _BlockingSink()
+    dispatcher = NotificationDispatcher([blocking, WebhookSink(_url(webhook_server))], retries=1)
+    try:
+        dispatcher.dispatch(_event())
+        lane = dispatcher._lanes["webhook"][PRIORITY_NORMAL]
+        lane.queue.join()
+        assert len(webhook_server.requests) == 1
+        assert blocking.received == []
+    finally:
+        blocking.release.set()
+        dispatcher.close(timeout=10)
+    assert blocking.received == ["Nuevos Espectadores de Historias"]
+
+
+def test_breaker_opens_after_consecutive_failures(webhook_server):
+    webhook_server.status = 500
+    dispatcher = NotificationDispatcher([WebhookSink(_url(webhook_server))], retries=1)
+    for i in range(NOTIFY_BREAKER_THRESHOLD + 3):
+        dispatcher.dispatch(_event(f"aviso {i}"))
+    dispatcher.close(timeout=10)
+
+    # Tras el umbral el circuito queda abierto y los avisos restantes no llegan al servidor
+    assert len(webhook_server.requests) == NOTIFY_BREAKER_THRESHOLD
+    assert dispatcher._lanes["webhook"][PRIORITY_NORMAL].breaker.opened_at is not None
+
+
+def test_half_open_breaker_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.record_failure()
+
+    # Pasado el tiempo de espera solo sale un intento, aunque lo pidan ambos carriles
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # La prueba falla: se reabre y, pasado el tiempo, sale otra prueba
+    assert breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+def test_sink_without_send_fails_on_creation():
+    class _Incomplete(NotificationSink):
+        name = "incompleto"
+
+    with pytest.raises(TypeError):
+        _Incomplete()
@@ -0,0 +1,49 @@
+import json
+import logging
+
+import pytest
+
+import notifier_logging
+
+
+@pytest.fixture
+def json_log(tmp_path, monkeypatch):
+    log_file = tmp_path / "alma.jsonl"
+    monkeypatch.setenv("LOG_FILE", str(log_file))
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    root = logging.getLogger()
+    previous_handlers, previous_level = root.handlers[:], root.level
+    notifier_logging.setup_logging()
+    yield log_file
+    notifier_logging.shutdown_logging()
+    root.handlers, root.level = previous_handlers, previous_level
+
+
+def _entries(log_file):
+    notifier_logging.shutdown_logging()
+    return [json.loads(line) for line in log_file.read_text(encoding="utf-8").splitlines()]
+
+
+def test_exception_traceback_goes_to_exc_field(json_log):
+    logger = logging.getLogger("insta-selenium.test")
+    try:
+        raise RuntimeError("fallo de prueba")
+    except RuntimeError:
+        logger.exception("Error al procesar %s", "historia")
+
+    (entry,) = _entries(json_log)
+    assert entry["msg"] == "Error al procesar historia"
+    assert entry["level"] == "ERROR"
+    assert "Traceback" in entry["exc"]
+    assert "RuntimeError: fallo de prueba" in entry["exc"]
+
+
+def test_context_ids_are_attached(json_log):
+    with notifier_logging.log_context(cycle_id="c1", story_id="s1"):
+        logging.getLogger("insta-selenium.test").info("Revisando")
+
+    (entry,) = _entries(json_log)
+    assert entry["msg"] == "Revisando"
+    assert entry["cycle_id"] == "c1"
+    assert entry["story_id"] == "s1"
+    assert "exc" not in entry
@@ -0,0 +1,59 @@
+from report_aggregator import RollingWindowAggregator
+
+T0 = 1_700_000_000.0
+MINUTE = 60
+
+
+def _report(aggregator, now):
+    payload = aggregator.payload(now)
+    aggregator.start_period(now)
+    return payload
+
+
+def test_viewer_right_after_report_shows_in_next_report():
+    aggregator = RollingWindowAggregator(window_seconds=3600, slots=12)
+    aggregator.record_new_viewers(T0 - 10 * MINUTE, "s1", ["bob"])
+    assert _report(aggregator, T0)["new_viewers"] == ["bob"]
+
+    aggregator.record_new_viewers(T0 + 1 * MINUTE, "s1", ["alice"])
+    # El siguiente reporte sale algo más de una hora después; alice ya salió de la ventana deslizante
+    report = _report(aggregator, T0 + 66 * MINUTE)
+
+    assert report["new_viewers"] == ["alice"]
+    assert report["unique_new_viewers"] == 1
+    assert _report(aggregator, T0 + 126 * MINUTE)["new_viewers"] == []
+
+
+def test_special_users_are_reported_once_per_period():
+    aggregator = RollingWindowAggregator(window_seconds=3600, slots=12)
+    aggregator.record_new_viewers(T0, "s1", ["ana", "vip"], special_users=["vip"])
+    aggregator.record_special(T0 + 5 * MINUTE, "vip")
+
+    report = _report(aggregator, T0 + 60 * MINUTE)
+    assert report["new_viewers"] == ["ana"]
+    assert report["special_users"] == ["vip"]
+    assert _report(aggregator, T0 + 120 * MINUTE)["special_users"] == []
+
+
+def test_story_breakdown_uses_rolling_window():
+    aggregator = RollingWindowAggregator(window_seconds=3600, slots=12)
+    aggregator.observe_story(T0, "s1", 10, "1h")
+    aggregator.record_new_viewers(T0, "s1", ["ana", "bob"])
+    aggregator.observe_story(T0 + 50 * MINUTE, "s1", 11, "2h")
+    aggregator.record_new_viewers(T0 + 50 * MINUTE, "s1", ["carl"])
+
+    report = aggregator.payload(T0 + 70 * MINUTE)
+    assert report["stories"] == {"s1": {"total": 11, "new": 1, "relative_time": "2h"}}
+    assert report["new_viewers"] == ["ana", "bob", "carl"]
+
+
+def test_checkpoint_keeps_period_counters():
+    aggregator = RollingWindowAggregator(window_seconds=3600, slots=12)
+    aggregator.start_period(T0)
+    aggregator.record_new_viewers(T0 + MINUTE, "s1", ["alice"], special_users=[])
+    aggregator.record_special(T0 + 2 * MINUTE, "vip")
+
+    restored = RollingWindowAggregator.from_dict(aggregator.to_dict())
+
+    assert restored.period_start == T0
+    assert restored.payload(T0 + 30 * MINUTE) == aggregator.payload(T0 + 30 * MINUTE)
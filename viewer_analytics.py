@@ -0,0 +1,286 @@
+import os
+import csv
+import json
+import math
+import time
+import argparse
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+ANALYTICS_FILE = os.getenv("ANALYTICS_FILE", "viewer_analytics.json")
+
+# Índices de los agregados por usuario
+_VIEWS, _LATENCY_SUM, _LATENCY_COUNT, _LATENCY_MIN, _FIRST_SEEN, _LAST_SEEN, _LAST_STORY, _STREAK, _BEST_STREAK = range(9)
+
+
+def story_posted_at(story_id: str) -> Optional[float]:
+    """El ID de la historia es su fecha de publicación en ISO (p. ej. 2025-09-11T23:38:50.000Z)."""
+    try:
+        return datetime.strptime(story_id, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class ViewerAnalytics:
+    """
+    Agregados del historial de espectadores que se actualizan con cada vista
+    registrada, de modo que las consultas no recorren el historial:
+
+    - latencia desde la publicación hasta la primera detección, por usuario
+    - rachas de historias consecutivas vistas y abandonos
+    - histograma por hora del día (global y por usuario)
+
+    Además guarda las vistas en columnas (historia, usuario, instante, latencia)
+    para exportarlas a CSV o Parquet.
+    """
+
+    def __init__(self):
+        self.stories: List[str] = []
+        self.story_posted: List[Optional[float]] = []
+        self._story_index: Dict[str, int] = {}
+        self.users: List[str] = []
+        self._user_index: Dict[str, int] = {}
+        # Vistas en formato columnar
+        self.view_story = array("I")
+        self.view_user = array("I")
+        self.view_seen_at = array("d")
+        self.view_latency = array("d")
+        # Agregados
+        self.user_stats: Dict[str, list] = {}
+        self.user_hours: Dict[str, List[int]] = {}
+        self.hours = [0] * 24
+        self.dirty = False
+
+    def _story(self, story_id: str) -> int:
+        index = self._story_index.get(story_id)
+        if index is None:
+            index = len(self.stories)
+            self.stories.append(story_id)
+            self.story_posted.append(story_posted_at(story_id))
+            self._story_index[story_id] = index
+        return index
+
+    def _user(self, username: str) -> int:
+        index = self._user_index.get(username)
+        if index is None:
+            index = len(self.users)
+            self.users.append(username)
+            self._user_index[username] = index
+        return index
+
+    def record_views(self, story_id: str, usernames, seen_at: Optional[float] = None):
+        """
+        Registra la primera detección de 'usernames' en la historia. 'seen_at' es
+        el instante de la detección; None si se desconoce (p. ej. al reconstruir).
+        """
+        story_index = self._story(story_id)
+        posted = self.story_posted[story_index]
+        latency = seen_at - posted if seen_at is not None and posted is not None else math.nan
+        hour = time.localtime(seen_at).tm_hour if seen_at is not None else None
+
+        for username in usernames:
+            self.view_story.append(story_index)
+            self.view_user.append(self._user(username))
+            self.view_seen_at.append(seen_at if seen_at is not None else math.nan)
+            self.view_latency.append(latency)
+
+            stats = self.user_stats.get(username)
+            if stats is None:
+                stats = [0, 0.0, 0, math.inf, seen_at, seen_at, -1, 0, 0]
+                self.user_stats[username] = stats
+            stats[_VIEWS] += 1
+            if not math.isnan(latency):
+                stats[_LATENCY_SUM] += latency
+                stats[_LATENCY_COUNT] += 1
+                stats[_LATENCY_MIN] = min(stats[_LATENCY_MIN], latency)
+            if seen_at is not None:
+                stats[_FIRST_SEEN] = seen_at if stats[_FIRST_SEEN] is None else min(stats[_FIRST_SEEN], seen_at)
+                stats[_LAST_SEEN] = seen_at if stats[_LAST_SEEN] is None else max(stats[_LAST_SEEN], seen_at)
+
+            # Racha de historias consecutivas; una vista tardía de una historia anterior no la altera
+            if story_index == stats[_LAST_STORY] + 1:
+                stats[_STREAK] += 1
+            elif story_index > stats[_LAST_STORY] + 1:
+                stats[_STREAK] = 1
+            stats[_LAST_STORY] = max(stats[_LAST_STORY], story_index)
+            stats[_BEST_STREAK] = max(stats[_BEST_STREAK], stats[_STREAK])
+
+            if hour is not None:
+                self.hours[hour] += 1
+                self.user_hours.setdefault(username, [0] * 24)[hour] += 1
+        self.dirty = True
+
+    # --- queries ---
+    def latency_by_user(self) -> List[tuple]:
+        """(usuario, vistas, latencia media en s, latencia mínima en s), de la más rápida a la más lenta."""
+        rows = []
+        for username, stats in self.user_stats.items():
+            if stats[_LATENCY_COUNT]:
+                rows.append((username, stats[_VIEWS], stats[_LATENCY_SUM] / stats[_LATENCY_COUNT], stats[_LATENCY_MIN]))
+        return sorted(rows, key=lambda row: row[2])
+
+    def streaks(self) -> List[tuple]:
+        """(usuario, racha actual, mejor racha), considerando la racha actual solo si sigue viva."""
+        latest = len(self.stories) - 1
+        rows = []
+        for username, stats in self.user_stats.items():
+            current = stats[_STREAK] if stats[_LAST_STORY] >= latest - 1 else 0
+            rows.append((username, current, stats[_BEST_STREAK]))
+        return sorted(rows, key=lambda row: (row[1], row[2]), reverse=True)
+
+    def dropoffs(self, missed: int = 3, min_views: int = 3) -> List[tuple]:
+        """Usuarios con al menos 'min_views' vistas que no han visto las últimas 'missed' historias."""
+        latest = len(self.stories) - 1
+        rows = []
+        for username, stats in self.user_stats.items():
+            if stats[_VIEWS] >= min_views and latest - stats[_LAST_STORY] >= missed:
+                rows.append((username, stats[_VIEWS], self.stories[stats[_LAST_STORY]], latest - stats[_LAST_STORY]))
+        return sorted(rows, key=lambda row: row[1], reverse=True)
+
+    def hourly_histogram(self, username: Optional[str] = None) -> List[int]:
+        if username is None:
+            return list(self.hours)
+        return list(self.user_hours.get(username, [0] * 24))
+
+    # --- export ---
+    def columns(self) -> Dict[str, list]:
+        return {
+            "story_id": [self.stories[i] for i in self.view_story],
+            "posted_at": [self.story_posted[i] for i in self.view_story],
+            "username": [self.users[i] for i in self.view_user],
+            "seen_at": [None if math.isnan(v) else v for v in self.view_seen_at],
+            "latency_seconds": [None if math.isnan(v) else v for v in self.view_latency],
+        }
+
+    def export(self, path: str, file_format: str = "csv"):
+        columns = self.columns()
+        if file_format == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError as e:
+                raise ValueError("La exportación a Parquet requiere pyarrow (pip install pyarrow).") from e
+            pyarrow.parquet.write_table(pyarrow.table(columns), path)
+        elif file_format == "csv":
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns.keys())
+                writer.writerows(zip(*columns.values()))
+        else:
+            raise ValueError(f"Formato de exportación desconocido: {file_format}")
+
+    # --- persistence ---
+    def save(self, path: str = ANALYTICS_FILE):
+        data = {
+            "stories": self.stories,
+            "users": self.users,
+            "views": {
+                "story": self.view_story.tolist(),
+                "user": self.view_user.tolist(),
+                "seen_at": [None if math.isnan(v) else v for v in self.view_seen_at],
+                "latency": [None if math.isnan(v) else v for v in self.view_latency],
+            },
+            "user_stats": {u: [None if isinstance(v, float) and math.isinf(v) else v for v in stats] for u, stats in self.user_stats.items()},
+            "user_hours": self.user_hours,
+            "hours": self.hours,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, path: str = ANALYTICS_FILE) -> "ViewerAnalytics":
+        analytics = cls()
+        if not os.path.exists(path):
+            return analytics
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for story_id in data["stories"]:
+            analytics._story(story_id)
+        for username in data["users"]:
+            analytics._user(username)
+        views = data["views"]
+        analytics.view_story = array("I", views["story"])
+        analytics.view_user = array("I", views["user"])
+        analytics.view_seen_at = array("d", (math.nan if v is None else v for v in views["seen_at"]))
+        analytics.view_latency = array("d", (math.nan if v is None else v for v in views["latency"]))
+        for username, stats in data["user_stats"].items():
+            if stats[_LATENCY_MIN] is None:
+                stats[_LATENCY_MIN] = math.inf
+            analytics.user_stats[username] = stats
+        analytics.user_hours = data["user_hours"]
+        analytics.hours = data["hours"]
+        return analytics
+
+    @classmethod
+    def rebuild_from_seen(cls, seen: Dict[str, list]) -> "ViewerAnalytics":
+        """
+        Reconstruye los agregados desde seen_viewers.json. Ese archivo no guarda
+        cuándo se detectó cada vista, así que no aporta latencias ni horas.
+        """
+        analytics = cls()
+        story_ids = sorted((story_id for story_id in seen if story_posted_at(story_id) is not None), key=story_posted_at)
+        for story_id in story_ids:
+            analytics.record_views(story_id, seen[story_id])
+        return analytics
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes = seconds / 60
+    return f"{minutes:.0f} min" if minutes < 120 else f"{minutes / 60:.1f} h"
+
+
+if __name__ == "__main__":
+    # Como CLI independiente nadie más carga el .env; ANALYTICS_FILE se leyó antes, así que se vuelve a leer
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Analítica del historial de espectadores de Alma.")
+    parser.add_argument("--file", default=os.getenv("ANALYTICS_FILE", ANALYTICS_FILE), help="Archivo de agregados.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    latency_parser = subparsers.add_parser("latency", help="Qué tan rápido ve cada usuario tras publicar.")
+    latency_parser.add_argument("--top", type=int, default=20)
+    streaks_parser = subparsers.add_parser("streaks", help="Rachas de historias consecutivas vistas.")
+    streaks_parser.add_argument("--top", type=int, default=20)
+    dropoffs_parser = subparsers.add_parser("dropoffs", help="Quién dejó de ver tus historias.")
+    dropoffs_parser.add_argument("--missed", type=int, default=3, help="Historias seguidas sin ver.")
+    dropoffs_parser.add_argument("--min-views", type=int, default=3, help="Vistas mínimas para considerarlo espectador habitual.")
+    hours_parser = subparsers.add_parser("hours", help="Vistas por hora del día.")
+    hours_parser.add_argument("--user", default=None)
+    export_parser = subparsers.add_parser("export", help="Exporta las vistas en formato columnar.")
+    export_parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    export_parser.add_argument("--out", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Reconstruye los agregados desde el archivo de espectadores vistos.")
+    rebuild_parser.add_argument("--seen", default=os.getenv("STORED_FILE", "seen_viewers.json"))
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        with open(args.seen, "r", encoding="utf-8") as f:
+            rebuilt = ViewerAnalytics.rebuild_from_seen(json.load(f))
+        rebuilt.save(args.file)
+        print(f"Agregados reconstruidos: {len(rebuilt.stories)} historias, {len(rebuilt.users)} usuarios, {len(rebuilt.view_user)} vistas.")
+    else:
+        analytics = ViewerAnalytics.load(args.file)
+        if args.command == "latency":
+            print(f"{'Usuario':<30}{'Vistas':>8}{'Media':>10}{'Mínima':>10}")
+            for username, views, mean, minimum in analytics.latency_by_user()[:args.top]:
+                print(f"{username:<30}{views:>8}{_format_seconds(mean):>10}{_format_seconds(minimum):>10}")
+        elif args.command == "streaks":
+            print(f"{'Usuario':<30}{'Actual':>8}{'Mejor':>8}")
+            for username, current, best in analytics.streaks()[:args.top]:
+                print(f"{username:<30}{current:>8}{best:>8}")
+        elif args.command == "dropoffs":
+            print(f"{'Usuario':<30}{'Vistas':>8}{'Última historia vista':>28}{'Sin ver':>9}")
+            for username, views, last_story, missed in analytics.dropoffs(args.missed, args.min_views):
+                print(f"{username:<30}{views:>8}{last_story:>28}{missed:>9}")
+        elif args.command == "hours":
+            histogram = analytics.hourly_histogram(args.user)
+            peak = max(histogram) or 1
+            for hour, count in enumerate(histogram):
+                print(f"{hour:02d}:00 {count:>6} {'█' * round(30 * count / peak)}")
+        elif args.command == "export":
+            analytics.export(args.out, args.format)
+            print(f"{len(analytics.view_user)} vistas exportadas a {args.out}")
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+from array import array
+from bisect import bisect_left
+from typing import Iterator, List, Optional, Tuple
+
+TIMESERIES_FILE = os.getenv("TIMESERIES_FILE", "viewer_timeseries.bin")
+# Días que se guardan muestra a muestra; lo anterior se reduce a una muestra por hora e historia
+TIMESERIES_RAW_DAYS = float(os.getenv("TIMESERIES_RAW_DAYS", "7"))
+
+_MAGIC = b"ALMATS1\n"
+_HOUR = 3600.0
+
+# (timestamp, story_id, total, nuevos)
+Sample = Tuple[float, str, int, int]
+
+
+class ViewerTimeSeries:
+    """
+    Serie temporal compacta de espectadores: una muestra (timestamp, historia,
+    total, nuevos) por historia y ciclo, guardada en arreglos tipados.
+
+    Las muestras de más de TIMESERIES_RAW_DAYS días se reducen a una por hora e
+    historia (máximo del total, suma de nuevos). El histograma por día de la
+    semana y hora se mantiene al agregar cada muestra, así que "¿cuándo aparecen
+    mis espectadores?" se responde sin recorrer el historial.
+    """
+
+    def __init__(self, raw_days: float = TIMESERIES_RAW_DAYS):
+        self.raw_seconds = raw_days * 86400
+        self.stories: List[str] = []
+        self._story_index = {}
+        # Muestras recientes, una por ciclo
+        self.ts = array("d")
+        self.story = array("I")
+        self.total = array("I")
+        self.new = array("I")
+        # Muestras antiguas, una por hora e historia
+        self.hourly_ts = array("d")
+        self.hourly_story = array("I")
+        self.hourly_total = array("I")
+        self.hourly_new = array("I")
+        # Nuevos espectadores por [día de la semana * 24 + hora] (hora local)
+        self.weekly_new = array("Q", [0] * (7 * 24))
+
+    def __len__(self):
+        return len(self.ts) + len(self.hourly_ts)
+
+    def _intern_story(self, story_id: str) -> int:
+        index = self._story_index.get(story_id)
+        if index is None:
+            index = len(self.stories)
+            self.stories.append(story_id)
+            self._story_index[story_id] = index
+        return index
+
+    def append(self, timestamp: float, story_id: str, total: int, new: int):
+        if self.ts and timestamp < self.ts[-1]:
+            timestamp = self.ts[-1]
+        self.ts.append(timestamp)
+        self.story.append(self._intern_story(story_id))
+        self.total.append(total)
+        self.new.append(new)
+        if new:
+            local = time.localtime(timestamp)
+            self.weekly_new[local.tm_wday * 24 + local.tm_hour] += new
+
+    def compact(self, now: Optional[float] = None):
+        """Reduce a muestras horarias todo lo anterior a la ventana de retención."""
+        now = time.time() if now is None else now
+        cutoff = bisect_left(self.ts, now - self.raw_seconds)
+        if cutoff == 0:
+            return
+
+        buckets = {}
+        for i in range(cutoff):
+            key = (self.ts[i] // _HOUR * _HOUR, self.story[i])
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [self.total[i], self.new[i]]
+            else:
+                bucket[0] = max(bucket[0], self.total[i])
+                bucket[1] += self.new[i]
+
+        # La primera hora puede continuar buckets ya reducidos en una compactación anterior
+        last_hour = self.hourly_ts[-1] if self.hourly_ts else None
+        open_buckets = {}
+        i = len(self.hourly_ts) - 1
+        while i >= 0 and self.hourly_ts[i] == last_hour:
+            open_buckets[self.hourly_story[i]] = i
+            i -= 1
+
+        for (hour, story), (total, new) in sorted(buckets.items()):
+            if hour == last_hour and story in open_buckets:
+                j = open_buckets[story]
+                self.hourly_total[j] = max(self.hourly_total[j], total)
+                self.hourly_new[j] += new
+                continue
+            self.hourly_ts.append(hour)
+            self.hourly_story.append(story)
+            self.hourly_total.append(total)
+            self.hourly_new.append(new)
+
+        for column in (self.ts, self.story, self.total, self.new):
+            del column[:cutoff]
+
+    def samples_since(self, since: float) -> Iterator[Sample]:
+        """Itera en orden cronológico las muestras (reducidas y recientes) desde 'since'."""
+        for ts_col, story_col, total_col, new_col in (
+            (self.hourly_ts, self.hourly_story, self.hourly_total, self.hourly_new),
+            (self.ts, self.story, self.total, self.new),
+        ):
+            for i in range(bisect_left(ts_col, since), len(ts_col)):
+                yield ts_col[i], self.stories[story_col[i]], total_col[i], new_col[i]
+
+    def hourly_histogram(self) -> List[int]:
+        """Nuevos espectadores por hora del día (0-23), sumando todos los días de la semana."""
+        return [sum(self.weekly_new[day * 24 + hour] for day in range(7)) for hour in range(24)]
+
+    def peak_hours(self, count: int = 3) -> List[int]:
+        histogram = self.hourly_histogram()
+        ranked = sorted(range(24), key=lambda hour: histogram[hour], reverse=True)
+        return [hour for hour in ranked[:count] if histogram[hour] > 0]
+
+    # --- persistence ---
+    def save(self, path: str = TIMESERIES_FILE):
+        """Escribe la serie en un archivo binario de forma atómica."""
+        columns = (self.ts, self.story, self.total, self.new,
+                   self.hourly_ts, self.hourly_story, self.hourly_total, self.hourly_new, self.weekly_new)
+        header = {
+            "stories": self.stories,
+            "columns": [[column.typecode, len(column)] for column in columns],
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+            for column in columns:
+                column.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = TIMESERIES_FILE, raw_days: float = TIMESERIES_RAW_DAYS) -> "ViewerTimeSeries":
+        series = cls(raw_days)
+        if not os.path.exists(path):
+            return series
+        with open(path, "rb") as f:
+            if f.readline() != _MAGIC:
+                raise ValueError(f"{path} no es un archivo de serie temporal de Alma.")
+            header = json.loads(f.readline().decode("utf-8"))
+            columns = []
+            for typecode, length in header["columns"]:
+                column = array(typecode)
+                column.fromfile(f, length)
+                columns.append(column)
+        (series.ts, series.story, series.total, series.new,
+         series.hourly_ts, series.hourly_story, series.hourly_total, series.hourly_new,
+         series.weekly_new) = columns
+        series.stories = header["stories"]
+        series._story_index = {story_id: i for i, story_id in enumerate(series.stories)}
+        return series
@@ -0,0 +1,235 @@
+import os
+import re
+import sys
+import json
+import string
+import logging
+import warnings
+from typing import Dict, Iterable, List, Optional
+
+from notification_sinks import PRIORITY_HIGH, PRIORITY_NORMAL
+from selenium_story_notifier import SPECIAL_USERS
+
+# Lista de vigilancia ampliada (opcional); se suma a SPECIAL_USERS
+WATCH_LIST_FILE = os.getenv("WATCH_LIST_FILE", "watch_list.json")
+# Máximo de nombres normalizados que se guardan en caché antes de vaciarla
+WATCH_LIST_CACHE_SIZE = 100_000
+
+MATCH_KINDS = ("exact", "prefix", "regex")
+PRIORITIES = {"high": PRIORITY_HIGH, "normal": PRIORITY_NORMAL}
+TEMPLATE_FIELDS = ("user", "label")
+
+logger = logging.getLogger("insta-selenium.watch")
+
+
+class WatchEntry:
+    """
+    Entrada de la lista de vigilancia.
+
+    'subject' y 'message' son plantillas opcionales con los campos {user} y
+    {label} (las llaves literales se escriben {{ y }}); si faltan se usan las
+    del aviso genérico. Las entradas 'featured' reciben el aviso destacado y el
+    mensaje de ausencia del reporte horario.
+
+    Con 'track' se sigue la presencia del usuario entre ciclos y se avisa
+    cuando deja de aparecer en todas las historias ('lost_subject' y
+    'lost_message' personalizan ese aviso). Por defecto solo lo hacen las
+    entradas exactas: un prefijo o una regex pueden coincidir con muchos nombres.
+    """
+
+    __slots__ = ("pattern", "match", "priority", "label", "featured", "subject", "message", "track", "lost_subject", "lost_message")
+
+    def __init__(self, pattern: str, match: str = "exact", priority: int = PRIORITY_HIGH, label: Optional[str] = None,
+                 featured: bool = False, subject: Optional[str] = None, message: Optional[str] = None,
+                 track: Optional[bool] = None, lost_subject: Optional[str] = None, lost_message: Optional[str] = None):
+        if match not in MATCH_KINDS:
+            raise ValueError(f"Tipo de coincidencia desconocido '{match}' para '{pattern}'; use uno de {', '.join(MATCH_KINDS)}.")
+        self.pattern = pattern if match == "regex" else pattern.casefold()
+        self.match = match
+        self.priority = priority
+        self.label = label
+        self.featured = featured
+        self.subject = _check_template(subject, pattern)
+        self.message = _check_template(message, pattern)
+        self.track = match == "exact" if track is None else track
+        self.lost_subject = _check_template(lost_subject, pattern)
+        self.lost_message = _check_template(lost_message, pattern)
+
+    def label_for(self, user: str) -> str:
+        return self.label or user
+
+    def _render(self, template: Optional[str], user: str) -> Optional[str]:
+        if not template:
+            return None
+        try:
+            return template.format(user=user, label=self.label_for(user))
+        except (KeyError, IndexError, ValueError, AttributeError, TypeError) as e:
+            # Un aviso con el texto genérico es mejor que ningún aviso
+            logger.error("No se pudo aplicar la plantilla de '%s'; se usa la genérica: %s", self.pattern, e)
+            return None
+
+    def render_subject(self, user: str) -> Optional[str]:
+        return self._render(self.subject, user)
+
+    def render_message(self, user: str) -> Optional[str]:
+        return self._render(self.message, user)
+
+    def render_lost_subject(self, user: str) -> Optional[str]:
+        return self._render(self.lost_subject, user)
+
+    def render_lost_message(self, user: str) -> Optional[str]:
+        return self._render(self.lost_message, user)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "WatchEntry":
+        priority = str(data.get("priority", "high")).lower()
+        if priority not in PRIORITIES:
+            raise ValueError(f"Prioridad desconocida '{priority}' para '{data.get('pattern')}'; use high o normal.")
+        return cls(
+            data["pattern"],
+            data.get("match", "exact"),
+            PRIORITIES[priority],
+            data.get("label"),
+            bool(data.get("featured", False)),
+            data.get("subject"),
+            data.get("message"),
+            data.get("track"),
+            data.get("lost_subject"),
+            data.get("lost_message"),
+        )
+
+
+def _check_template(template: Optional[str], pattern: str) -> Optional[str]:
+    """Rechaza al cargar las plantillas que fallarían al enviar el aviso."""
+    if not template:
+        return template
+    try:
+        fields = {field for _, field, _, _ in string.Formatter().parse(template) if field is not None}
+        unknown = fields - set(TEMPLATE_FIELDS)
+        if unknown:
+            raise ValueError(f"campos desconocidos {', '.join(sorted(unknown))}")
+        template.format(user=pattern, label=pattern)
+    except (KeyError, IndexError, ValueError, AttributeError, TypeError) as e:
+        raise ValueError(
+            f"Plantilla inválida para '{pattern}': {e}. Use solo {{user}} y {{label}}; "
+            f"las llaves literales se escriben {{{{ y }}}}."
+        ) from e
+    return template
+
+
+class WatchList:
+    """
+    Lista de vigilancia compilada una sola vez.
+
+    Las entradas exactas van a un diccionario, los prefijos a un diccionario por
+    longitud y las expresiones regulares a una sola alternancia que descarta de
+    una vez a los nombres que no coinciden con ninguna (si alguna lleva banderas
+    globales en línea que impiden combinarlas, se prueban una a una). Cada lote de espectadores
+    se recorre una vez: el coste es O(espectadores × longitudes de prefijo
+    distintas), no O(espectadores × entradas). Los nombres normalizados con
+    casefold se internan y se guardan en caché, porque casi todos se repiten
+    entre ciclos.
+    """
+
+    def __init__(self, entries: Iterable[WatchEntry] = ()):
+        self.entries: List[WatchEntry] = []
+        self._exact: Dict[str, WatchEntry] = {}
+        self._prefixes: Dict[str, WatchEntry] = {}
+        self._prefix_lengths: List[int] = []
+        self._regex_entries: List[tuple] = []
+        self._regex_any = None
+        self._folded: Dict[str, str] = {}
+        for entry in entries:
+            self._add(entry)
+        self._compile()
+
+    def _add(self, entry: WatchEntry):
+        self.entries.append(entry)
+        if entry.match == "exact":
+            self._exact[entry.pattern] = entry
+        elif entry.match == "prefix":
+            self._prefixes[entry.pattern] = entry
+        else:
+            try:
+                self._regex_entries.append((re.compile(entry.pattern, re.IGNORECASE), entry))
+            except re.error as e:
+                raise ValueError(f"Expresión regular inválida '{entry.pattern}': {e}") from e
+
+    def _compile(self):
+        # Los prefijos más largos primero: gana la coincidencia más específica
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._prefixes}, reverse=True)
+        self._regex_any = None
+        if self._regex_entries:
+            combined = "|".join(f"(?:{regex.pattern})" for regex, _ in self._regex_entries)
+            try:
+                # Las banderas globales en línea como (?i) solo valen al inicio del patrón y
+                # no se pueden combinar; en Python < 3.11 solo avisan y se aplicarían a todos
+                with warnings.catch_warnings():
+                    warnings.simplefilter("error", DeprecationWarning)
+                    self._regex_any = re.compile(combined, re.IGNORECASE)
+            except (re.error, DeprecationWarning) as e:
+                logger.warning("No se pudieron combinar las expresiones regulares (%s); se comprobarán una a una.", e)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def fold(self, username: str) -> str:
+        folded = self._folded.get(username)
+        if folded is None:
+            if len(self._folded) >= WATCH_LIST_CACHE_SIZE:
+                self._folded.clear()
+            folded = self._folded[username] = sys.intern(username.casefold())
+        return folded
+
+    def lookup(self, username: str) -> Optional[WatchEntry]:
+        """Entrada que corresponde a un nombre: exacta, luego prefijo más largo, luego regex."""
+        folded = self.fold(username)
+        entry = self._exact.get(folded)
+        if entry is not None:
+            return entry
+        for length in self._prefix_lengths:
+            if len(folded) >= length:
+                entry = self._prefixes.get(folded[:length])
+                if entry is not None:
+                    return entry
+        # Sin la alternancia combinada se prueban las expresiones una a una
+        if self._regex_entries and (self._regex_any is None or self._regex_any.fullmatch(folded)):
+            for regex, entry in self._regex_entries:
+                if regex.fullmatch(folded):
+                    return entry
+        return None
+
+    def match(self, usernames: Iterable[str]) -> Dict[str, WatchEntry]:
+        """Devuelve {nombre normalizado: entrada} para los nombres del lote que están en la lista."""
+        matches = {}
+        for username in usernames:
+            entry = self.lookup(username)
+            if entry is not None:
+                matches[self.fold(username)] = entry
+        return matches
+
+    def is_watched(self, username: str) -> bool:
+        return self.lookup(username) is not None
+
+    def featured_labels(self) -> List[str]:
+        return [entry.label_for(entry.pattern) for entry in self.entries if entry.featured]
+
+
+def load_watch_list(path: str = WATCH_LIST_FILE, special_users: Iterable[str] = SPECIAL_USERS) -> WatchList:
+    """
+    Construye la lista desde SPECIAL_USERS (coincidencia exacta, prioridad alta)
+    y desde el archivo JSON 'path' si existe. Una entrada del archivo sustituye
+    a la de SPECIAL_USERS con el mismo nombre.
+    """
+    file_entries = []
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            raise ValueError(f"{path} debe contener una lista de entradas.")
+        file_entries = [WatchEntry.from_dict(item) for item in data]
+    overridden = {entry.pattern for entry in file_entries if entry.match == "exact"}
+    entries = [WatchEntry(user) for user in sorted(special_users) if user.casefold() not in overridden]
+    watch_list = WatchList(entries + file_entries)
+    logger.info("Lista de vigilancia cargada con %d entradas.", len(watch_list.entries))
+    return watch_list